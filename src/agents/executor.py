@@ -11,6 +11,38 @@ from src.utils.logger import logger
 from src.utils.performance import record_query_performance
 from src.utils.semantic_cache import get_semantic_cached_result, set_semantic_cached_result
 
+def semantic_cache_hit(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Looks up the semantic cache for a question.
+
+    Args:
+        question: Natural language question.
+
+    Returns:
+        Metadata dict (same shape as execute_query with return_metadata=True)
+        on a cache hit, None on a miss or when the semantic cache is disabled.
+    """
+    if os.getenv("ENABLE_SEMANTIC_CACHE", "true").lower() not in ("true", "1", "yes"):
+        return None
+    try:
+        semantic_cache_result = get_semantic_cached_result(question)
+    except Exception as e:
+        logger.warning(f"Error checking semantic cache: {e}. Continuing...")
+        return None
+    if not semantic_cache_result:
+        return None
+
+    result, sql_generated = semantic_cache_result
+    logger.info("Result obtained from semantic cache")
+    return {
+        "response": result,
+        "sql_generated": sql_generated,
+        "execution_time": 0.0,
+        "success": True,
+        "cache_hit_type": "semantic",
+    }
+
+
 def execute_query(
     agent: Any,
     question: str,
@@ -19,6 +51,7 @@ def execute_query(
     stream: bool = False,
     stream_callback: Any | None = None,
     prefer_analysis: bool = True,
+    check_semantic_cache: bool = True,
 ) -> Union[str, Dict[str, Any]]:
     """
     Executes a natural language question using the agent with retry logic.
@@ -31,6 +64,8 @@ def execute_query(
         stream: If True, uses streaming mode.
         stream_callback: Optional callback for real-time streaming info.
         prefer_analysis: If True, prioritizes LLM analysis over raw tool output.
+        check_semantic_cache: If False, skips the semantic cache lookup (the caller
+            already did it with semantic_cache_hit); results are still stored.
 
     Returns:
         Agent response (str) or dict with metadata.
@@ -40,26 +75,10 @@ def execute_query(
     _SQL_EXECUTION_INFO.set(None)
 
     # 1. Semantic Cache check (only if enabled)
-    semantic_cache_result = None
-    if os.getenv("ENABLE_SEMANTIC_CACHE", "true").lower() in ("true", "1", "yes"):
-        try:
-            semantic_cache_result = get_semantic_cached_result(question)
-            if semantic_cache_result:
-                result, sql_generated = semantic_cache_result
-                logger.info("Result obtained from semantic cache")
-                
-                if return_metadata:
-                    return {
-                        "response": result,
-                        "sql_generated": sql_generated,
-                        "execution_time": 0.0,
-                        "success": True,
-                        "cache_hit_type": "semantic",
-                    }
-                
-                return result
-        except Exception as e:
-            logger.warning(f"Error checking semantic cache: {e}. Continuing...")
+    if check_semantic_cache:
+        cached = semantic_cache_hit(question)
+        if cached is not None:
+            return cached if return_metadata else cached["response"]
 
     last_error = None
     
@@ -196,12 +215,11 @@ def execute_query(
 
             # Adjust SQL/cache info from context
             exec_info = _SQL_EXECUTION_INFO.get()
-            if exec_info:
-                executed_sql, was_sql_cache_hit = exec_info
-                if executed_sql:
-                    sql_generated = executed_sql
-                if was_sql_cache_hit:
-                    cache_hit_type = "sql"
+            if exec_info is not None:
+                if exec_info.query:
+                    sql_generated = exec_info.query
+                if exec_info.cache_hit:
+                    cache_hit_type = exec_info.cache_hit_type
 
             # Save to semantic cache if successful
             if sql_generated and response and not response.startswith("Error"):
@@ -1,16 +1,59 @@
 """Agente para explicar queries SQL antes de ejecutarlas."""
 
+import os
+import threading
+import time
+from collections import OrderedDict
 from typing import Any
 
 from dotenv import load_dotenv
 from sqlalchemy import Engine, text
 
+from src.utils.cache import get_sql_hash
 from src.utils.llm_factory import get_chat_model
 from src.utils.logger import logger
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Cache LRU+TTL de explicaciones: la misma SQL sobre la misma DB no vuelve a llamar al LLM.
+_EXPLAIN_CACHE_MAX_ENTRIES = 1024
+_explain_cache_ttl_seconds = int(os.getenv("EXPLAIN_CACHE_TTL_SECONDS", "3600"))  # Default: 1 hora
+_explain_cache: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+_explain_cache_lock = threading.Lock()
+
+
+def _explain_cache_key(sql: str, engine: Engine) -> tuple[str, str]:
+    """Key del cache: hash del SQL normalizado + URL del engine (sin password)."""
+    return get_sql_hash(sql), str(getattr(engine, "url", ""))
+
+
+def _get_cached_explanation(key: tuple[str, str]) -> str | None:
+    with _explain_cache_lock:
+        entry = _explain_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, explanation = entry
+        if time.monotonic() > expires_at:
+            del _explain_cache[key]
+            return None
+        _explain_cache.move_to_end(key)
+        return explanation
+
+
+def _set_cached_explanation(key: tuple[str, str], explanation: str) -> None:
+    with _explain_cache_lock:
+        _explain_cache[key] = (time.monotonic() + _explain_cache_ttl_seconds, explanation)
+        _explain_cache.move_to_end(key)
+        while len(_explain_cache) > _EXPLAIN_CACHE_MAX_ENTRIES:
+            _explain_cache.popitem(last=False)
+
+
+def clear_explain_cache() -> None:
+    """Limpia el cache de explicaciones."""
+    with _explain_cache_lock:
+        _explain_cache.clear()
+
 
 def explain_query(sql: str, engine: Engine) -> str:
     """
@@ -24,6 +67,12 @@ def explain_query(sql: str, engine: Engine) -> str:
         Explicación en lenguaje natural de la query
     """
     try:
+        cache_key = _explain_cache_key(sql, engine)
+        cached = _get_cached_explanation(cache_key)
+        if cached is not None:
+            logger.debug("Explicación de query servida desde cache")
+            return cached
+
         # Obtener EXPLAIN plan de PostgreSQL
         explain_plan = _get_explain_plan(sql, engine)
         
@@ -48,6 +97,7 @@ Explicación:"""
         
         response = llm.invoke(prompt)
         explanation = response.content if hasattr(response, 'content') else str(response)
+        _set_cached_explanation(cache_key, explanation)
         
         logger.info("Explicación de query generada exitosamente")
         return explanation
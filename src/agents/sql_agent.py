@@ -15,7 +15,7 @@ from src.agents.prompts import (
     classify_query_complexity as _classify_query_complexity
 )
 from src.agents.parser import parse_streaming_chunk as _parse_streaming_chunk
-from src.agents.tools import _SQL_EXECUTION_INFO
+from src.agents.tools import _SQL_EXECUTION_INFO, SqlExecInfo
 
 # Imports that were present in the old file and are mocked/used by tests
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
@@ -37,6 +37,7 @@ __all__ = [
     "_classify_query_complexity",
     "_parse_streaming_chunk",
     "_SQL_EXECUTION_INFO",
+    "SqlExecInfo",
     "SQLDatabaseToolkit",
     "SQLDatabase",
     "tool_decorator",
@@ -3,7 +3,8 @@
 import os
 import time
 from contextvars import ContextVar
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import Optional
 
 from langchain.tools import tool as tool_decorator, BaseTool
 from src.utils.logger import logger
@@ -13,8 +14,17 @@ from src.agents.error_recovery import recover_from_error, should_attempt_recover
 from src.schemas.database_schema import get_schema_for_prompt
 from src.validators.sql_validator import SQLValidator
 
+@dataclass(slots=True)
+class SqlExecInfo:
+    """SQL executed by the validated tool and whether it came from the SQL cache."""
+
+    query: str
+    cache_hit: bool
+    cache_hit_type: str = "none"
+
+
 # Context variable to track SQL execution info across the request
-_SQL_EXECUTION_INFO: ContextVar[Optional[Tuple[str, bool]]] = ContextVar(
+_SQL_EXECUTION_INFO: ContextVar[Optional[SqlExecInfo]] = ContextVar(
     "_SQL_EXECUTION_INFO",
     default=None,
 )
@@ -57,7 +67,7 @@ def create_validated_sql_tool(schema, validator: SQLValidator, raw_sql_tool: Bas
             cached_result = get_cached_result(query)
             if cached_result is not None:
                 logger.info("Result obtained from SQL cache")
-                _SQL_EXECUTION_INFO.set((query, True))
+                _SQL_EXECUTION_INFO.set(SqlExecInfo(query, True, "sql"))
                 return cached_result
 
             # Execute query with timeout
@@ -97,7 +107,7 @@ def create_validated_sql_tool(schema, validator: SQLValidator, raw_sql_tool: Bas
                     cache_hit=False
                 )
                 
-                _SQL_EXECUTION_INFO.set((query, False))
+                _SQL_EXECUTION_INFO.set(SqlExecInfo(query, False))
                 return formatted_result
 
             except Exception as db_error:
@@ -139,7 +149,7 @@ def create_validated_sql_tool(schema, validator: SQLValidator, raw_sql_tool: Bas
                                     formatted_result = "No se encontraron datos que coincidan con la consulta."
                                     logger.info("Corrected query executed successfully but no results. Returning formatted message.")
                                     set_cached_result(corrected_sql, formatted_result)
-                                    _SQL_EXECUTION_INFO.set((corrected_sql, False))
+                                    _SQL_EXECUTION_INFO.set(SqlExecInfo(corrected_sql, False))
                                     return formatted_result
                                 else:
                                     # Save to cache
@@ -152,7 +162,7 @@ def create_validated_sql_tool(schema, validator: SQLValidator, raw_sql_tool: Bas
                                     corrected_sql=corrected_sql
                                 )
                                 
-                                _SQL_EXECUTION_INFO.set((corrected_sql, False))
+                                _SQL_EXECUTION_INFO.set(SqlExecInfo(corrected_sql, False))
                                 return result
                                 
                             except Exception as validation_error:
@@ -3,15 +3,40 @@
 Ejemplos:
     python -m src.api
     WEB_API_HOST=127.0.0.1 WEB_API_PORT=8000 python -m src.api
+    WEB_API_WORKERS=4 python -m src.api
 """
 
 from __future__ import annotations
 
+import importlib.util
+import multiprocessing
 import os
 
 import uvicorn
 
 
+def _resolve_workers(reload_enabled: bool) -> int:
+    """Calcula el número de workers (1 en modo reload; si no, basado en CPUs)."""
+    if reload_enabled:
+        return 1
+
+    raw_value = os.getenv("WEB_API_WORKERS")
+    if raw_value:
+        try:
+            return max(1, int(raw_value))
+        except ValueError:
+            pass
+
+    return max(2, multiprocessing.cpu_count())
+
+
+def _resolve_loop_and_http() -> tuple[str, str]:
+    """Usa uvloop/httptools si están instalados (uvicorn[standard]); si no, asyncio/h11."""
+    loop = "uvloop" if importlib.util.find_spec("uvloop") is not None else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+    return loop, http
+
+
 def main() -> None:
     """Inicia el servidor ASGI con Uvicorn."""
     host = os.getenv("WEB_API_HOST", "127.0.0.1")
@@ -21,10 +46,19 @@ def main() -> None:
         port = 8000
 
     reload_enabled = os.getenv("WEB_API_RELOAD", "false").lower() in ("true", "1", "yes")
+    workers = _resolve_workers(reload_enabled)
+    loop, http = _resolve_loop_and_http()
 
-    uvicorn.run("src.api.app:app", host=host, port=port, reload=reload_enabled)
+    uvicorn.run(
+        "src.api.app:app",
+        host=host,
+        port=port,
+        reload=reload_enabled,
+        loop=loop,
+        http=http,
+        workers=workers,
+    )
 
 
 if __name__ == "__main__":
     main()
-
@@ -2,7 +2,11 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -10,14 +14,17 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from src import __version__
 from src.api.routers import health, history, query, schema, stats, validate_sql
+from src.api.services.query_service import flush_history_queue, warmup
 from src.utils.logger import logger
 
 API_V1_PREFIX = "/api/v1"
 
-DEFAULT_ALLOWED_ORIGINS = ["http://localhost:3000"]
+DEFAULT_ALLOWED_ORIGINS: tuple[str, ...] = ("http://localhost:3000",)
 
 
-def _parse_allowed_origins(env_value: str | None) -> list[str]:
+@lru_cache(maxsize=4)
+def _parse_allowed_origins(env_value: str | None) -> tuple[str, ...]:
+    """Parsea WEB_ALLOWED_ORIGINS (cacheado por valor crudo del env)."""
     if env_value is None:
         return DEFAULT_ALLOWED_ORIGINS
 
@@ -25,7 +32,7 @@ def _parse_allowed_origins(env_value: str | None) -> list[str]:
     if not raw_value:
         return DEFAULT_ALLOWED_ORIGINS
 
-    origins = [origin.strip() for origin in raw_value.split(",") if origin.strip()]
+    origins = [origin for origin in (part.strip() for part in raw_value.split(",")) if origin]
 
     if "*" in origins:
         logger.warning(
@@ -34,7 +41,28 @@ def _parse_allowed_origins(env_value: str | None) -> list[str]:
         )
         origins = [origin for origin in origins if origin != "*"]
 
-    return origins or DEFAULT_ALLOWED_ORIGINS
+    return tuple(origins) or DEFAULT_ALLOWED_ORIGINS
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Pre-calienta embeddings/schema/engine/agente al arrancar (desactivable con WEB_API_WARMUP=false).
+
+    El warm-up corre en un hilo en background: el servidor acepta requests de inmediato
+    y los primeros que lleguen esperan solo lo que aún no esté cargado. Al apagar se
+    espera a que el historial encolado termine de escribirse.
+    """
+    warmup_future: asyncio.Future[None] | None = None
+    if os.getenv("WEB_API_WARMUP", "true").lower() in ("true", "1", "yes"):
+        warmup_future = asyncio.get_running_loop().run_in_executor(None, warmup)
+    yield
+    if warmup_future is not None:
+        try:
+            await warmup_future
+        except Exception as e:
+            logger.warning(f"Warm-up del API falló: {e}")
+    if not await asyncio.get_running_loop().run_in_executor(None, flush_history_queue):
+        logger.warning("No se terminó de guardar el historial pendiente al apagar el API")
 
 
 def create_app() -> FastAPI:
@@ -44,9 +72,10 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="LLM Data Warehouse API",
         version=__version__,
+        lifespan=_lifespan,
     )
 
-    allowed_origins = _parse_allowed_origins(os.getenv("WEB_ALLOWED_ORIGINS"))
+    allowed_origins = list(_parse_allowed_origins(os.getenv("WEB_ALLOWED_ORIGINS")))
     logger.info(f"CORS allow_origins={allowed_origins}")
     app.add_middleware(
         CORSMiddleware,
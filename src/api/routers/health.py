@@ -8,9 +8,12 @@ from src.api.models import HealthResponse
 
 router = APIRouter(tags=["health"])
 
+# Respuesta constante: se construye una sola vez al importar el módulo.
+_HEALTH_OK = HealthResponse()
+
 
 @router.get("/health", response_model=HealthResponse)
-def healthcheck() -> HealthResponse:
+async def healthcheck() -> HealthResponse:
     """Healthcheck básico (no toca la base de datos)."""
-    return HealthResponse()
+    return _HEALTH_OK
 
@@ -2,12 +2,11 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-
 from fastapi import APIRouter, Query
 
 from src.api.models import ClearHistoryResponse, HistoryEntry, HistoryResponse
 from src.utils.history import clear_history, load_history
+from src.utils.timestamps import filter_by_days
 
 router = APIRouter(tags=["history"])
 
@@ -18,29 +17,20 @@ def history_endpoint(
     offset: int = Query(default=0, ge=0, le=10_000, description="Offset para paginación."),
     days: int | None = Query(default=None, ge=1, le=365, description="Filtrar entradas de los últimos N días."),
 ) -> HistoryResponse:
-    """Retorna historial local (archivo JSON) con paginación básica."""
+    """Retorna historial local (archivo JSONL) con paginación básica."""
     entries = load_history(limit=None)
 
     if days is not None:
-        cutoff = datetime.now() - timedelta(days=days)
-        filtered = []
-        for entry in entries:
-            ts_raw = entry.get("timestamp")
-            if not ts_raw:
-                continue
-            try:
-                ts = datetime.fromisoformat(ts_raw)
-            except ValueError:
-                continue
-            if ts >= cutoff:
-                filtered.append(entry)
-        entries = filtered
+        entries = filter_by_days(entries, days)
 
     total = len(entries)
-    sliced = entries[offset : offset + limit]
+    if offset >= total:
+        return HistoryResponse.model_construct(total=total, items=[])
 
-    items = [HistoryEntry(**entry) for entry in sliced]
-    return HistoryResponse(total=total, items=items)
+    # Las entradas las escribe save_query (datos ya conocidos): model_construct evita
+    # revalidarlas y solo se construyen las de la página pedida.
+    items = [HistoryEntry.model_construct(**entry) for entry in entries[offset : offset + limit]]
+    return HistoryResponse.model_construct(total=total, items=items)
 
 
 @router.post("/history/clear", response_model=ClearHistoryResponse)
@@ -3,14 +3,16 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import os
 import threading
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+import orjson
 from fastapi import APIRouter
 from fastapi import Query as FastAPIQuery
-from fastapi import Request
-from fastapi.responses import StreamingResponse
+from fastapi.sse import EventSourceResponse, ServerSentEvent
 
 from src.api.models import QueryRequest, QueryResponse
 from src.api.services.query_service import run_query, run_query_stream
@@ -18,13 +20,21 @@ from src.utils.logger import logger
 
 router = APIRouter(tags=["query"])
 
+# Máximo de lotes pendientes en la cola SSE y reintento del drain cuando está llena.
+_MAX_PENDING_BATCHES = 256
+_DRAIN_RETRY_SECONDS = 0.005
+# Máximo de eventos que el hilo acumula antes de esperar al siguiente drain (cliente lento).
+_MAX_PENDING_EVENTS = 1024
+_PENDING_WAIT_SECONDS = 0.05
 
-def _format_sse(event: str, data: Any) -> bytes:
-    try:
-        payload = json.dumps(data, ensure_ascii=False)
-    except TypeError:
-        payload = json.dumps(str(data), ensure_ascii=False)
-    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+# Pool compartido y acotado para ejecutar run_query_stream (en lugar de un Thread por request).
+_STREAM_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="query-stream")
+
+
+def _sse_event(event: str, data: Any) -> ServerSentEvent:
+    # orjson serializa el payload; los valores no serializables caen a str().
+    payload = orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return ServerSentEvent(event=event, raw_data=payload)
 
 
 @router.post("/query", response_model=QueryResponse)
@@ -33,17 +43,55 @@ def query_endpoint(request: QueryRequest) -> QueryResponse:
     return run_query(request)
 
 
-@router.get("/query/stream")
+@router.get("/query/stream", response_class=EventSourceResponse)
 async def query_stream_endpoint(
-    request: Request,
     question: str = FastAPIQuery(min_length=1, max_length=2000),
     limit: int | None = FastAPIQuery(default=None, ge=1, le=10_000),
     explain: bool = FastAPIQuery(default=False),
-) -> StreamingResponse:
-    """Ejecuta una consulta en streaming usando Server-Sent Events (SSE)."""
+) -> AsyncIterator[ServerSentEvent]:
+    """Ejecuta una consulta en streaming usando Server-Sent Events (SSE).
+
+    EventSourceResponse se encarga del framing, los heartbeats (`: ping`) y de
+    cancelar el generador si el cliente se desconecta.
+    """
     loop = asyncio.get_running_loop()
     stop_event = threading.Event()
-    events: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+    # El hilo acumula eventos en `pending` y agenda un único drain por ráfaga, en
+    # lugar de un call_soon_threadsafe por chunk. La cola guarda lotes y está acotada;
+    # `pending` también: con _MAX_PENDING_EVENTS el hilo espera a que drain lo vacíe,
+    # así un cliente lento frena al productor en vez de acumular memoria.
+    events: asyncio.Queue[list[dict[str, Any]]] = asyncio.Queue(maxsize=_MAX_PENDING_BATCHES)
+    pending: list[dict[str, Any]] = []
+    pending_ready = threading.Condition()
+    drain_scheduled = False
+
+    def drain() -> None:
+        nonlocal drain_scheduled
+        if events.full():
+            loop.call_later(_DRAIN_RETRY_SECONDS, drain)
+            return
+        with pending_ready:
+            batch = pending.copy()
+            pending.clear()
+            drain_scheduled = False
+            pending_ready.notify_all()
+        if batch:
+            events.put_nowait(batch)
+
+    def emit(item: dict[str, Any]) -> None:
+        nonlocal drain_scheduled
+        with pending_ready:
+            while len(pending) >= _MAX_PENDING_EVENTS and not stop_event.is_set() and not loop.is_closed():
+                pending_ready.wait(_PENDING_WAIT_SECONDS)
+            pending.append(item)
+            if drain_scheduled:
+                return
+            drain_scheduled = True
+        try:
+            loop.call_soon_threadsafe(drain)
+        except RuntimeError:
+            # El event loop ya cerró (cliente desconectado / servidor apagándose).
+            pass
 
     def stream_callback(chunk_info: dict | None) -> None:
         if stop_event.is_set() or not chunk_info:
@@ -51,15 +99,14 @@ async def query_stream_endpoint(
 
         event_type = str(chunk_info.get("type") or "analysis")
         if event_type == "error":
-            loop.call_soon_threadsafe(
-                events.put_nowait,
+            emit(
                 {
                     "event": "error",
                     "data": {
                         "code": "query_error",
                         "message": str(chunk_info.get("content") or "Error en ejecución."),
                     },
-                },
+                }
             )
             return
 
@@ -69,7 +116,7 @@ async def query_stream_endpoint(
             "sql": chunk_info.get("sql"),
             "complete": chunk_info.get("complete"),
         }
-        loop.call_soon_threadsafe(events.put_nowait, {"event": event_type, "data": payload})
+        emit({"event": event_type, "data": payload})
 
     def worker() -> None:
         try:
@@ -79,7 +126,9 @@ async def query_stream_endpoint(
                 explain=explain,
                 stream_callback=stream_callback,
             )
-            loop.call_soon_threadsafe(events.put_nowait, {"event": "done", "data": response.model_dump()})
+            # Pydantic serializa el modelo (y sus `rows`) directo a JSON en Rust, sin pasar
+            # por un dict intermedio; fallback=str como el default de _sse_event.
+            emit({"event": "done", "raw_data": response.model_dump_json(fallback=str)})
         except Exception as e:
             logger.exception("Error en /query/stream")
             
@@ -90,44 +139,33 @@ async def query_stream_endpoint(
             if os.getenv("SHOW_DETAILED_ERRORS", "false").lower() == "true":
                 user_message = str(e)
 
-            loop.call_soon_threadsafe(
-                events.put_nowait,
+            emit(
                 {
                     "event": "error",
                     "data": {"code": "stream_exception", "message": user_message},
-                },
+                }
             )
         finally:
-            loop.call_soon_threadsafe(events.put_nowait, {"event": "__close__", "data": None})
+            emit({"event": "__close__", "data": None})
 
-    threading.Thread(target=worker, daemon=True).start()
+    worker_future = loop.run_in_executor(_STREAM_EXECUTOR, worker)
 
-    async def event_generator():
-        yield b": ok\n\n"
+    yield ServerSentEvent(comment="ok")
+    try:
         while True:
-            if await request.is_disconnected():
-                stop_event.set()
-                break
-
-            try:
-                item = await asyncio.wait_for(events.get(), timeout=15.0)
-            except asyncio.TimeoutError:
-                yield b": ping\n\n"
-                continue
-
-            if item.get("event") == "__close__":
-                break
-
-            yield _format_sse(str(item.get("event")), item.get("data"))
-
+            # Un wakeup puede entregar varios lotes: se vacían todos antes de volver a esperar.
+            batch = await events.get()
+            while not events.empty():
+                batch.extend(events.get_nowait())
+
+            for item in batch:
+                if item.get("event") == "__close__":
+                    await worker_future
+                    return
+                raw_data = item.get("raw_data")
+                if raw_data is not None:
+                    yield ServerSentEvent(event=str(item.get("event")), raw_data=raw_data)
+                else:
+                    yield _sse_event(str(item.get("event")), item.get("data"))
+    finally:
         stop_event.set()
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-store",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
-    )
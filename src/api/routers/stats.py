@@ -2,32 +2,18 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import heapq
 from typing import Any
 
 from fastapi import APIRouter, Query
 
+from src.api.responses import ORJSONResponse
 from src.utils.performance import get_performance_stats, load_performance_metrics
+from src.utils.timestamps import filter_by_days
 
 router = APIRouter(tags=["stats"])
 
 
-def _filter_metrics_by_days(metrics: list[dict[str, Any]], days: int) -> list[dict[str, Any]]:
-    cutoff = datetime.now() - timedelta(days=days)
-    filtered: list[dict[str, Any]] = []
-    for metric in metrics:
-        ts_raw = metric.get("timestamp")
-        if not ts_raw:
-            continue
-        try:
-            ts = datetime.fromisoformat(ts_raw)
-        except ValueError:
-            continue
-        if ts >= cutoff:
-            filtered.append(metric)
-    return filtered
-
-
 @router.get("/stats")
 def stats_endpoint(
     days: int = Query(default=7, ge=1, le=365, description="Ventana de tiempo (días) para agregados."),
@@ -38,60 +24,65 @@ def stats_endpoint(
         description="Threshold para considerar una query lenta.",
     ),
     limit: int = Query(default=10, ge=1, le=100, description="Máximo de items por lista."),
-) -> dict[str, Any]:
+) -> ORJSONResponse:
     """Devuelve métricas agregadas y lists de queries lentas/fallidas."""
     stats = get_performance_stats(days=days)
 
     all_metrics = load_performance_metrics(limit=None)
-    recent_metrics = _filter_metrics_by_days(all_metrics, days=days)
-
-    slow_queries = [
-        m
-        for m in recent_metrics
-        if m.get("success", False)
-        and m.get("execution_time", 0) >= slow_threshold_seconds
-        and str(m.get("sql", "")).strip()
-    ]
-    slow_queries.sort(key=lambda m: m.get("execution_time", 0), reverse=True)
+    recent_metrics = filter_by_days(all_metrics, days=days)
 
-    failed_queries = [m for m in recent_metrics if not m.get("success", True)]
-    failed_queries.sort(key=lambda m: m.get("timestamp", ""), reverse=True)
-
-    patterns: dict[str, dict[str, Any]] = {}
+    # Una sola pasada: candidatas lentas, fallidas y agregado de patrones.
+    slow_candidates: list[dict[str, Any]] = []
+    failed_candidates: list[dict[str, Any]] = []
+    # Acumulador por sql_hash: [sql_preview, count, total_time, success_count]; las listas
+    # se mutan más rápido que dicts y los dicts de salida solo se arman para el top-k.
+    patterns: dict[str, list[Any]] = {}
     for metric in recent_metrics:
-        sql = str(metric.get("sql", "")).strip()
+        # Cada campo se lee y normaliza una sola vez por métrica.
+        success = metric.get("success")
+        if not success and "success" in metric:
+            failed_candidates.append(metric)
+
+        sql = str(metric.get("sql") or "").strip()
         if not sql:
             continue
-        sql_hash = str(metric.get("sql_hash", "unknown"))
-        if sql_hash not in patterns:
-            patterns[sql_hash] = {
-                "sql_hash": sql_hash,
-                "sql_preview": sql[:100],
-                "count": 0,
-                "total_time": 0.0,
-                "avg_time": 0.0,
-                "success_count": 0,
-                "fail_count": 0,
-            }
-        pattern = patterns[sql_hash]
-        pattern["count"] += 1
-        pattern["total_time"] += float(metric.get("execution_time", 0) or 0.0)
-        if metric.get("success", False):
-            pattern["success_count"] += 1
-        else:
-            pattern["fail_count"] += 1
 
-    pattern_list = []
-    for pattern in patterns.values():
-        if pattern["count"] > 0:
-            pattern["avg_time"] = pattern["total_time"] / pattern["count"]
-            pattern_list.append(pattern)
-    pattern_list.sort(key=lambda p: p["count"], reverse=True)
+        execution_time = float(metric.get("execution_time") or 0.0)
+        if success and execution_time >= slow_threshold_seconds:
+            slow_candidates.append(metric)
+
+        sql_hash = str(metric.get("sql_hash") or "unknown")
+        acc = patterns.get(sql_hash)
+        if acc is None:
+            acc = patterns[sql_hash] = [sql[:100], 0, 0.0, 0]
+        acc[1] += 1
+        acc[2] += execution_time
+        if success:
+            acc[3] += 1
+
+    # nlargest: O(N log k) y mismo orden estable que sort(reverse=True)[:limit].
+    slow_queries = heapq.nlargest(limit, slow_candidates, key=lambda m: m.get("execution_time", 0))
+    failed_queries = heapq.nlargest(limit, failed_candidates, key=lambda m: m.get("timestamp", ""))
+    top_patterns = heapq.nlargest(limit, patterns.items(), key=lambda item: item[1][1])
+    pattern_list = [
+        {
+            "sql_hash": sql_hash,
+            "sql_preview": sql_preview,
+            "count": count,
+            "total_time": total_time,
+            "avg_time": total_time / count,
+            "success_count": success_count,
+            "fail_count": count - success_count,
+        }
+        for sql_hash, (sql_preview, count, total_time, success_count) in top_patterns
+    ]
 
-    return {
-        "stats": stats,
-        "recent_metrics_count": len(recent_metrics),
-        "slow_queries": slow_queries[:limit],
-        "failed_queries": failed_queries[:limit],
-        "patterns": pattern_list[:limit],
-    }
+    return ORJSONResponse(
+        content={
+            "stats": stats,
+            "recent_metrics_count": len(recent_metrics),
+            "slow_queries": slow_queries,
+            "failed_queries": failed_queries,
+            "patterns": pattern_list,
+        }
+    )
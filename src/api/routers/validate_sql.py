@@ -5,12 +5,27 @@ from __future__ import annotations
 from fastapi import APIRouter
 
 from src.api.models import ValidateSQLRequest, ValidateSQLResponse
-from src.schemas.database_schema import load_schema
+from src.schemas.database_schema import DatabaseSchema, load_schema
 from src.utils.exceptions import SQLValidationError
 from src.validators.sql_validator import SQLValidator
 
 router = APIRouter(tags=["validate-sql"])
 
+# Último validador construido y el schema al que pertenece (se reutiliza mientras
+# load_schema devuelva el mismo objeto; su índice de columnas se calcula una vez)
+_cached_validator: tuple[DatabaseSchema, SQLValidator] | None = None
+
+
+def _get_validator(schema: DatabaseSchema) -> SQLValidator:
+    """Retorna el validador del schema actual, reutilizándolo entre requests."""
+    global _cached_validator
+
+    cached = _cached_validator
+    if cached is None or cached[0] is not schema:
+        cached = (schema, SQLValidator(schema))
+        _cached_validator = cached
+    return cached[1]
+
 
 @router.post("/validate-sql", response_model=ValidateSQLResponse)
 def validate_sql_endpoint(request: ValidateSQLRequest) -> ValidateSQLResponse:
@@ -19,8 +34,8 @@ def validate_sql_endpoint(request: ValidateSQLRequest) -> ValidateSQLResponse:
     if not sql:
         return ValidateSQLResponse(valid=False, errors=["SQL vacío o inválido."])
 
-    schema = load_schema()
-    validator = SQLValidator(schema)
+    schema = load_schema(stale_while_revalidate=True)
+    validator = _get_validator(schema)
 
     tables: list[str] = []
     try:
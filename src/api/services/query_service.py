@@ -4,36 +4,177 @@ from __future__ import annotations
 
 import ast
 import re
+import queue
+import sys
+import threading
+import time
+from functools import lru_cache
+from itertools import chain, islice
 from typing import Any
 
+import orjson
 import sqlglot
 from sqlglot import exp
+from sqlglot.tokens import TokenType
 
 from src.agents.query_explainer import explain_query
 from src.agents.sql_agent import create_sql_agent, execute_query
 from src.api.models import APIError, QueryRequest, QueryResponse
-from src.schemas.database_schema import load_schema
+from src.api.services.schema_service import get_schema_response_bytes
+from src.schemas.database_schema import get_schema_version, load_schema
 from src.utils.database import get_db_engine
-from src.utils.history import save_query
+from src.utils.history import build_history_entry, save_history_entries
 from src.utils.logger import logger
 from src.utils.semantic_cache import initialize_semantic_cache
 
+try:
+    # Opcional: parser JSON incremental (backend en C) para cortar en `limit` filas.
+    import ijson
+except ImportError:
+    ijson = None
+
+# Agente compartido entre requests: se crea sin `question`, así que no depende de la
+# consulta, y el grafo compilado no guarda estado entre invocaciones (la pregunta viaja
+# en los mensajes). Se recrea cuando cambia el schema o el engine.
+_shared_agent: tuple[Any, Any, Any] | None = None  # (schema, engine, agent)
+_shared_agent_lock = threading.Lock()
+
+# El historial se escribe fuera del request: una cola acotada y un único hilo escritor
+# que agrupa hasta _HISTORY_BATCH_SIZE entradas por escritura (y mantiene el orden).
+_HISTORY_QUEUE: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=4096)
+_HISTORY_BATCH_SIZE = 64
+_history_writer: threading.Thread | None = None
+_history_writer_lock = threading.Lock()
+
+# El modelo de embeddings se intenta pre-cargar una sola vez por proceso (aunque falle).
+_semantic_cache_ready = False
+_semantic_cache_lock = threading.Lock()
+
+_QUOTE_RE = re.compile(r'^"|"$')
+_WS_RE = re.compile(r"\s+")
+# `SELECT * FROM ...` no aporta nombres de columna: se evita parsear con sqlglot.
+_SELECT_STAR_RE = re.compile(r"^\s*select\s+\*\s+from\b", re.IGNORECASE)
+
+# Respuestas JSON mayores a esto se parsean en streaming cuando hay `limit` (si ijson está instalado).
+_STREAM_PARSE_MIN_CHARS = 64 * 1024
+# Por encima de esto no se parsea la respuesta completa (salvo en streaming acotado por `limit`).
+_MAX_PARSE_CHARS = 8 * 1024 * 1024
+
+
+# Tokens que cierran la lista de proyección a profundidad 0.
+_PROJECTION_END_TOKENS = frozenset(
+    {
+        TokenType.FROM,
+        TokenType.INTO,
+        TokenType.WHERE,
+        TokenType.GROUP_BY,
+        TokenType.HAVING,
+        TokenType.ORDER_BY,
+        TokenType.LIMIT,
+        TokenType.UNION,
+        TokenType.EXCEPT,
+        TokenType.INTERSECT,
+        TokenType.SEMICOLON,
+    }
+)
+_IDENTIFIER_TOKENS = frozenset({TokenType.VAR, TokenType.IDENTIFIER})
+
+
+def _projection_item_name(item: list[Any]) -> str | None:
+    """Nombre de un item del SELECT si es `expr AS alias`, `col` o `tabla.col`; None si no."""
+    if len(item) >= 3 and item[-2].token_type == TokenType.ALIAS:
+        return item[-1].text
+    if len(item) == 1 and item[0].token_type in _IDENTIFIER_TOKENS:
+        return item[0].text
+    # tabla.col / schema.tabla.col: después del punto cualquier palabra es nombre de columna.
+    if len(item) % 2 == 1 and all(tok.token_type == TokenType.DOT for tok in item[1::2]):
+        if item[0].token_type in _IDENTIFIER_TOKENS and item[-1].token_type != TokenType.STAR:
+            return item[-1].text
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _project_headers_from_tokens(sql: str, num_cols: int) -> tuple[str, ...] | None:
+    """Nombres de las primeras `num_cols` columnas usando solo el tokenizer de sqlglot.
+
+    Cubre los casos comunes (alias, columnas simples o calificadas); cualquier otro item
+    devuelve None para que el caller use el AST completo.
+    """
+    try:
+        tokens = sqlglot.tokenize(sql, read="postgres")
+    except Exception:
+        return None
 
-def _extract_column_names_from_sql(sql: str | None, num_cols: int) -> list[str] | None:
-    """Extrae nombres de columnas del SELECT (best-effort) usando sqlglot."""
-    if not sql:
+    if not tokens or tokens[0].token_type != TokenType.SELECT:
         return None
 
+    start = 2 if len(tokens) > 1 and tokens[1].token_type == TokenType.DISTINCT else 1
+    headers: list[str] = []
+    item: list[Any] = []
+    depth = 0
+    for tok in tokens[start:]:
+        token_type = tok.token_type
+        if depth == 0 and (token_type == TokenType.COMMA or token_type in _PROJECTION_END_TOKENS):
+            name = _projection_item_name(item)
+            if name is None:
+                return None
+            headers.append(name)
+            if len(headers) == num_cols or token_type != TokenType.COMMA:
+                break
+            item = []
+            continue
+        if token_type == TokenType.L_PAREN:
+            depth += 1
+        elif token_type == TokenType.R_PAREN:
+            depth -= 1
+        item.append(tok)
+    else:
+        name = _projection_item_name(item)
+        if name is None:
+            return None
+        headers.append(name)
+
+    return tuple(headers) if len(headers) == num_cols else None
+
+
+def _clean_header(header: str) -> str:
+    """Quita comillas del nombre de columna y lo interna (se repite como key en cada fila)."""
+    return sys.intern(_QUOTE_RE.sub("", header).strip())
+
+
+@lru_cache(maxsize=64)
+def _default_headers(num_cols: int) -> tuple[str, ...]:
+    """Headers sintéticos col_1..col_N (internados y cacheados por número de columnas)."""
+    return tuple(sys.intern(f"col_{i + 1}") for i in range(num_cols))
+
+
+@lru_cache(maxsize=1024)
+def _parse_select(sql: str) -> exp.Select | None:
+    """Parsea un SELECT con sqlglot, cacheado por SQL (el AST se usa solo para lectura)."""
     try:
         expression = sqlglot.parse_one(sql, read="postgres")
     except Exception:
         return None
 
-    if not isinstance(expression, exp.Select):
+    return expression if isinstance(expression, exp.Select) else None
+
+
+def _extract_column_names_from_sql(sql: str | None, num_cols: int) -> list[str] | None:
+    """Extrae nombres de columnas del SELECT (best-effort) usando sqlglot."""
+    if not sql or _SELECT_STAR_RE.match(sql):
+        return None
+
+    # Fast-path: solo tokenizer (sin parser ni AST) para proyecciones simples.
+    token_headers = _project_headers_from_tokens(sql, num_cols)
+    if token_headers is not None:
+        return [_clean_header(h) for h in token_headers]
+
+    expression = _parse_select(sql)
+    if expression is None:
         return None
 
     headers: list[str] = []
-    for select_item in expression.expressions:
+    for select_item in expression.expressions[:num_cols]:
         if isinstance(select_item, exp.Alias):
             headers.append(select_item.alias_or_name)
         elif isinstance(select_item, exp.Column):
@@ -43,21 +184,39 @@ def _extract_column_names_from_sql(sql: str | None, num_cols: int) -> list[str]
                 headers.append(select_item.this.name)
             else:
                 # Fallback for complex expressions in CAST
-                headers.append(select_item.sqlgen())
+                headers.append(select_item.sql(dialect="postgres"))
         elif hasattr(select_item, 'name'): # For functions, etc.
             headers.append(select_item.name)
         else:
-            headers.append(select_item.sqlgen()) # Fallback for complex expressions
-
-        if len(headers) == num_cols:
-            break
+            headers.append(select_item.sql(dialect="postgres")) # Fallback for complex expressions
 
     # Clean up headers (remove quotes from column names if present)
-    cleaned_headers = [re.sub(r'^"|"$', '', h).strip() for h in headers]
+    cleaned_headers = [_clean_header(h) for h in headers]
 
     return cleaned_headers if len(cleaned_headers) == num_cols else None
 
 
+def _literal_eval_rows(normalized: str) -> Any | None:
+    """Parsea el repr de Python de las filas (fallback lento); None si no es un literal."""
+    try:
+        return ast.literal_eval(normalized)
+    except (ValueError, SyntaxError):
+        # Algunos resultados vienen con saltos de línea/espacios raros (p.ej. dentro de strings).
+        cleaned = _WS_RE.sub(" ", normalized)
+        try:
+            return ast.literal_eval(cleaned)
+        except (ValueError, SyntaxError):
+            return None
+
+
+def _stream_parse_rows(normalized: str, limit: int) -> list[Any] | None:
+    """Parsea solo las primeras `limit` filas de un array JSON grande; None si no es JSON válido."""
+    try:
+        return list(islice(ijson.items(normalized.encode("utf-8"), "item", use_float=True), limit))
+    except ijson.JSONError:
+        return None
+
+
 def _parse_rows_from_response(
     response: str | None, sql_generated: str | None, limit: int | None
 ) -> tuple[list[str] | None, list[dict[str, Any]] | None]:
@@ -69,60 +228,124 @@ def _parse_rows_from_response(
     if not normalized:
         return None, None
 
-    if not (normalized.startswith("[") or normalized.startswith("{")):
+    # Sniff O(1): solo se intenta parsear si abre y cierra como lista/dict.
+    if normalized[0] not in "[{" or normalized[-1] not in "]}":
         return None, None
 
-    try:
-        parsed: Any = ast.literal_eval(normalized)
-    except (ValueError, SyntaxError):
-        # Algunos resultados vienen con saltos de línea/espacios raros.
-        cleaned = re.sub(r"\\s+", " ", normalized)
-        cleaned = cleaned.replace(" ,", ",").replace(", ", ",")
-        try:
-            parsed = ast.literal_eval(cleaned)
-        except (ValueError, SyntaxError):
+    # Arrays JSON grandes con `limit`: se detiene el parseo tras `limit` filas en lugar de
+    # materializar toda la respuesta.
+    parsed: Any = None
+    if (
+        ijson is not None
+        and limit is not None
+        and limit > 0
+        and len(normalized) > _STREAM_PARSE_MIN_CHARS
+        and normalized.startswith("[")
+    ):
+        parsed = _stream_parse_rows(normalized, limit)
+
+    # Fast-path: payloads JSON (listas/dicts) se parsean en C con orjson; el repr de
+    # Python (tuplas, comillas simples, None) cae a ast.literal_eval.
+    if parsed is None:
+        if len(normalized) > _MAX_PARSE_CHARS:
+            logger.warning(
+                f"Respuesta de {len(normalized)} caracteres excede {_MAX_PARSE_CHARS}; se omite el parseo tabular"
+            )
             return None, None
+        try:
+            parsed = orjson.loads(normalized)
+        except orjson.JSONDecodeError:
+            parsed = _literal_eval_rows(normalized)
+            if parsed is None:
+                return None, None
 
     # Lista de tuplas/listas: filas tabulares
     if isinstance(parsed, list) and parsed:
         if isinstance(parsed[0], (tuple, list)):
-            rows_list = [list(row) for row in parsed]
-            if not rows_list:
-                return None, None
-
-            num_cols = len(rows_list[0])
-            headers = _extract_column_names_from_sql(sql_generated, num_cols) or [
-                f"col_{i + 1}" for i in range(num_cols)
-            ]
-
-            row_dicts: list[dict[str, Any]] = []
-            for row in rows_list:
-                row_dicts.append({headers[i]: (row[i] if i < len(row) else None) for i in range(num_cols)})
+            num_cols = len(parsed[0])
+            # Sin SQL (respuesta desde texto/cache semántico) ni se intenta extraer nombres.
+            headers = (_extract_column_names_from_sql(sql_generated, num_cols) if sql_generated else None) or list(
+                _default_headers(num_cols)
+            )
 
+            # Se recorta antes de materializar filas: con limit << N no se asigna el resto.
             if limit is not None:
-                row_dicts = row_dicts[:limit]
-
+                if limit <= 0:
+                    return headers, []
+                parsed = parsed[:limit]
+
+            # dict(zip(...)) construye cada fila en C directamente sobre la tupla/lista
+            # original (sin copiarla): zip trunca filas largas y las cortas se rellenan con None.
+            padding = (None,) * num_cols
+            row_dicts: list[dict[str, Any]] = [
+                dict(zip(headers, row if len(row) >= num_cols else (*row, *padding[len(row) :])))
+                for row in parsed
+            ]
             return headers, row_dicts
 
         # Lista de dicts: ya estructurado
         if isinstance(parsed[0], dict):
-            row_dicts = [dict(row) for row in parsed if isinstance(row, dict)]
-            if limit is not None:
-                row_dicts = row_dicts[:limit]
+            dict_rows = (dict(row) for row in parsed if isinstance(row, dict))
+            row_dicts = list(islice(dict_rows, max(limit, 0))) if limit is not None else list(dict_rows)
 
             # Columnas como unión de keys (orden estable por aparición).
-            columns: list[str] = []
-            seen: set[str] = set()
-            for row in row_dicts:
-                for key in row.keys():
-                    if key not in seen:
-                        seen.add(key)
-                        columns.append(str(key))
+            columns = [str(key) for key in dict.fromkeys(chain.from_iterable(row_dicts))]
             return columns or None, row_dicts or None
 
     return None, None
 
 
+def _history_writer_loop() -> None:
+    """Consume la cola de historial y escribe las entradas por lotes."""
+    while True:
+        batch = [_HISTORY_QUEUE.get()]
+        while len(batch) < _HISTORY_BATCH_SIZE:
+            try:
+                batch.append(_HISTORY_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            save_history_entries(batch)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar historial: {e}")
+        finally:
+            for _ in batch:
+                _HISTORY_QUEUE.task_done()
+
+
+def _save_query_in_background(**kwargs: Any) -> None:
+    """Encola la entrada de historial (con el timestamp de ahora) sin bloquear la respuesta."""
+    global _history_writer
+    if _history_writer is None:
+        with _history_writer_lock:
+            if _history_writer is None:
+                _history_writer = threading.Thread(
+                    target=_history_writer_loop, name="query-history", daemon=True
+                )
+                _history_writer.start()
+
+    try:
+        _HISTORY_QUEUE.put_nowait(build_history_entry(**kwargs))
+    except queue.Full:
+        logger.warning("Cola de historial llena; se descarta la entrada")
+
+
+def flush_history_queue(timeout: float = 5.0) -> bool:
+    """Espera hasta `timeout` segundos a que el hilo escritor guarde el historial encolado.
+
+    El hilo es daemon: sin esta espera, las entradas pendientes se pierden al apagar
+    el proceso. Retorna False si quedaron entradas sin escribir.
+    """
+    deadline = time.monotonic() + timeout
+    with _HISTORY_QUEUE.all_tasks_done:
+        while _HISTORY_QUEUE.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _HISTORY_QUEUE.all_tasks_done.wait(remaining)
+    return True
+
+
 def _build_query_response(
     *,
     question: str,
@@ -134,24 +357,23 @@ def _build_query_response(
     """Construye QueryResponse a partir del resultado de execute_query()."""
     if not isinstance(execute_result, dict):
         response_text = str(execute_result)
-        save_query(question=question, sql=None, response=response_text, success=not response_text.startswith("Error"))
+        _save_query_in_background(
+            question=question, sql=None, response=response_text, success=not response_text.startswith("Error")
+        )
         return QueryResponse(success=not response_text.startswith("Error"), response=response_text)
 
     response_text = execute_result.get("response")
     sql_generated = execute_result.get("sql_generated")
     success = bool(execute_result.get("success"))
 
-    try:
-        save_query(
-            question=question,
-            sql=sql_generated,
-            response=response_text,
-            success=success,
-            cache_hit_type=execute_result.get("cache_hit_type"),
-            model_used=execute_result.get("model_used"),
-        )
-    except Exception as e:
-        logger.warning(f"No se pudo guardar historial: {e}")
+    _save_query_in_background(
+        question=question,
+        sql=sql_generated,
+        response=response_text,
+        success=success,
+        cache_hit_type=execute_result.get("cache_hit_type"),
+        model_used=execute_result.get("model_used"),
+    )
 
     columns, rows = _parse_rows_from_response(response_text, sql_generated, limit)
 
@@ -164,7 +386,9 @@ def _build_query_response(
         message = response_text or "Error al ejecutar la query."
         error = APIError(code="query_failed", message=message)
 
-    return QueryResponse(
+    # Los campos ya vienen tipados de execute_query/_parse_rows_from_response; model_construct
+    # evita revalidar (y copiar) `rows`, que domina el costo en respuestas grandes.
+    return QueryResponse.model_construct(
         success=success,
         response=response_text,
         columns=columns,
@@ -181,6 +405,82 @@ def _build_query_response(
     )
 
 
+def _get_shared_agent(engine: Any, schema: Any) -> Any:
+    """Retorna el agente compartido para (schema, engine), creándolo si hace falta."""
+    global _shared_agent
+    cached = _shared_agent
+    if cached is not None and cached[0] is schema and cached[1] is engine:
+        return cached[2]
+
+    with _shared_agent_lock:
+        cached = _shared_agent
+        if cached is not None and cached[0] is schema and cached[1] is engine:
+            return cached[2]
+        # Igual que el CLI: sin `question` para no inicializar el clasificador ML en cada query.
+        agent = create_sql_agent(engine, schema)
+        _shared_agent = (schema, engine, agent)
+        return agent
+
+
+def _ensure_semantic_cache() -> None:
+    """Pre-carga embeddings (semantic cache) como en el CLI, una sola vez por proceso."""
+    global _semantic_cache_ready
+    if _semantic_cache_ready:
+        return
+    # Si el warm-up en background ya está cargando el modelo, se espera en lugar de cargarlo dos veces.
+    with _semantic_cache_lock:
+        if _semantic_cache_ready:
+            return
+        try:
+            initialize_semantic_cache()
+        except Exception as e:
+            logger.debug(f"No se pudo pre-cargar modelo de embeddings: {e}")
+        _semantic_cache_ready = True
+
+
+def get_or_create_agent() -> tuple[Any, Any]:
+    """Retorna (engine, agente) reutilizando schema, engine y agente cacheados del proceso."""
+    _ensure_semantic_cache()
+    schema = load_schema(stale_while_revalidate=True)
+    engine = get_db_engine()
+    return engine, _get_shared_agent(engine, schema)
+
+
+def reset_shared_agent() -> None:
+    """Descarta el agente compartido (helper para tests).
+
+    El API no cambia la configuración del LLM en caliente: las variables de entorno se
+    leen al crear el agente, así que solo se recrea al reiniciar el proceso o cuando
+    cambian schema/engine.
+    """
+    global _shared_agent
+    with _shared_agent_lock:
+        _shared_agent = None
+
+
+def warmup() -> None:
+    """Pre-carga embeddings, schema, engine y el agente compartido para evitar cold-start en el primer /query."""
+    _ensure_semantic_cache()
+
+    try:
+        schema = load_schema()
+        # Payload por defecto de GET /schema (compact, sin límite) ya serializado.
+        get_schema_response_bytes(schema, get_schema_version(), compact=True, max_tables=None)
+        engine = get_db_engine()
+    except Exception as e:
+        logger.warning(f"Warm-up: no se pudo pre-cargar schema/engine: {e}")
+        return
+
+    # Deja creado el agente compartido que reutilizarán los requests.
+    try:
+        _get_shared_agent(engine, schema)
+    except Exception as e:
+        logger.warning(f"Warm-up: no se pudo crear agente canario: {e}")
+        return
+
+    logger.info("Warm-up del API completado (embeddings, schema, engine y agente)")
+
+
 def run_query(request: QueryRequest) -> QueryResponse:
     """Ejecuta una consulta (single-shot) reusando el core existente."""
     question = request.question.strip()
@@ -199,18 +499,7 @@ def run_query(request: QueryRequest) -> QueryResponse:
             ),
         )
 
-    # Pre-cargar embeddings (semantic cache) como en el CLI, para evitar cold-start en la primera query.
-    try:
-        initialize_semantic_cache()
-    except Exception as e:
-        logger.debug(f"No se pudo pre-cargar modelo de embeddings: {e}")
-
-    schema = load_schema()
-    engine = get_db_engine()
-
-    # Igual que el CLI: crear agente sin pasar `question` para evitar inicializar el clasificador ML en cada query.
-    agent = create_sql_agent(engine, schema)
-
+    engine, agent = get_or_create_agent()
     result = execute_query(agent, question, return_metadata=True, stream=False)
     return _build_query_response(
         question=question,
@@ -236,16 +525,7 @@ def run_query_stream(
             error=APIError(code="invalid_question", message="La pregunta no puede estar vacía."),
         )
 
-    # Pre-cargar embeddings (semantic cache) como en el CLI, para evitar cold-start en la primera query.
-    try:
-        initialize_semantic_cache()
-    except Exception as e:
-        logger.debug(f"No se pudo pre-cargar modelo de embeddings: {e}")
-
-    schema = load_schema()
-    engine = get_db_engine()
-
-    agent = create_sql_agent(engine, schema)
+    engine, agent = get_or_create_agent()
     result = execute_query(
         agent,
         question_clean,
@@ -0,0 +1,100 @@
+"""Servicios para exponer el schema desde el API HTTP."""
+
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+import orjson
+
+from src.schemas.database_schema import DatabaseSchema
+
+# Bytes serializados de /schema por (compact, max_tables). Válidos solo para el
+# schema (objeto + versión) con el que se construyeron.
+_MAX_CACHED_VARIANTS = 32
+_schema_bytes_cache: dict[tuple[bool, int | None], bytes] = {}
+_schema_bytes_owner: tuple[int, DatabaseSchema | None] = (-1, None)
+_schema_bytes_lock = threading.Lock()
+
+
+def build_schema_payload(schema: DatabaseSchema, compact: bool, max_tables: int | None) -> dict[str, Any]:
+    """Construye el payload de /schema como dicts planos (equivalente a SchemaResponse con exclude_none)."""
+    tables = sorted(schema.tables.values(), key=lambda t: t.name)
+    total_tables = len(tables)
+
+    if max_tables is not None:
+        tables = tables[:max_tables]
+
+    response_tables: list[dict[str, Any]] = []
+    for table in tables:
+        table_data: dict[str, Any] = {"name": table.name}
+        if table.description:
+            table_data["description"] = table.description
+
+        if compact:
+            table_data["columns"] = [{"name": col.name} for col in table.columns]
+        else:
+            columns: list[dict[str, Any]] = []
+            for col in table.columns:
+                column_data: dict[str, Any] = {"name": col.name}
+                if col.type is not None:
+                    column_data["type"] = col.type
+                if col.nullable is not None:
+                    column_data["nullable"] = col.nullable
+                columns.append(column_data)
+            table_data["columns"] = columns
+            if table.primary_key:
+                table_data["primary_key"] = table.primary_key
+            if table.foreign_keys:
+                table_data["foreign_keys"] = table.foreign_keys
+
+        response_tables.append(table_data)
+
+    return {
+        "table_count": total_tables,
+        "returned_table_count": len(response_tables),
+        "compact": compact,
+        "tables": response_tables,
+    }
+
+
+def get_schema_response_bytes(
+    schema: DatabaseSchema,
+    version: int,
+    compact: bool,
+    max_tables: int | None,
+) -> bytes:
+    """
+    Retorna el JSON de /schema ya serializado, cacheado por versión del schema.
+
+    Args:
+        schema: Schema actual (de load_schema)
+        version: Versión del schema (get_schema_version); al cambiar invalida el cache
+        compact: Si se omiten tipos/keys
+        max_tables: Máximo de tablas a incluir
+
+    Returns:
+        Bytes JSON listos para enviar
+    """
+    global _schema_bytes_owner
+
+    key = (compact, max_tables)
+    with _schema_bytes_lock:
+        owner_version, owner_schema = _schema_bytes_owner
+        if owner_version != version or owner_schema is not schema:
+            _schema_bytes_cache.clear()
+            _schema_bytes_owner = (version, schema)
+
+        cached = _schema_bytes_cache.get(key)
+        if cached is not None:
+            return cached
+
+    body = orjson.dumps(build_schema_payload(schema, compact, max_tables))
+
+    with _schema_bytes_lock:
+        if _schema_bytes_owner == (version, schema):
+            if len(_schema_bytes_cache) >= _MAX_CACHED_VARIANTS:
+                _schema_bytes_cache.clear()
+            _schema_bytes_cache[key] = body
+
+    return body
@@ -2,18 +2,30 @@
 
 import ast
 import json
+import math
+import re
 import sys
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any
+from decimal import Decimal
+from functools import lru_cache
+from itertools import filterfalse, zip_longest
+from typing import Any, Callable
 
 import click
-from rich.console import Console
+import orjson
+from rich import box
+from rich.cells import cell_len
+from rich.console import Console, Group
+from rich.json import JSON
 from rich.live import Live
 from rich.panel import Panel
 from rich.syntax import Syntax
 from rich.table import Table
 from rich.text import Text
 from rich.layout import Layout
+from pygments.lexers.sql import SqlLexer
 from sqlalchemy import Engine
 
 from src.agents.query_explainer import explain_query, explain_query_simple
@@ -40,6 +52,56 @@ from src.validators.sql_validator import SQLValidator
 
 console = Console()
 
+# Patrones precompilados para _extract_column_names_from_sql y _format_query_result
+_RE_LINE_COMMENT = re.compile(r"--.*?$", re.MULTILINE)
+_RE_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_RE_SELECT_FROM = re.compile(r"SELECT\s+(.+?)\s+FROM", re.DOTALL | re.IGNORECASE)
+_RE_AS_ALIAS = re.compile(r"\bAS\s+[\"']?([a-zA-Z_][a-zA-Z0-9_]*)[\"']?", re.IGNORECASE)
+# Clasifica la columna en un solo match: agregado (con columna interna opcional) o función de fecha
+_RE_COL_KIND = re.compile(
+    r"(?P<agg>SUM|COUNT|AVG|MAX|MIN)\s*\((?:\s*(?:[a-zA-Z_]+\.)?(?P<inner>[a-zA-Z_]+))?"
+    r"|(?P<date>DATE_TRUNC|TO_CHAR|EXTRACT)",
+    re.IGNORECASE,
+)
+_AGG_HEADERS = {"COUNT": "Cantidad", "AVG": "Promedio", "MAX": "Máximo", "MIN": "Mínimo"}
+
+# Tablas para quitar separadores numéricos con un solo str.translate
+_STRIP_NUMERIC_SEPARATORS = str.maketrans("", "", ".-,")
+_STRIP_THOUSANDS_SEPARATORS = str.maketrans("", "", ",.")
+# Con más filas que esto, el ancho de columnas se fija a partir de una muestra
+# (Rich omite medir todas las celdas en columnas de ancho fijo)
+_FIXED_WIDTH_MIN_ROWS = 200
+_WIDTH_SAMPLE_ROWS = 50
+# Tuplas -> listas JSON (solo seguro si la respuesta no tiene strings)
+_TUPLES_TO_LISTS = str.maketrans("()", "[]")
+_RE_FUNC_OPEN = re.compile(r"[A-Z_]+\s*\(")
+_RE_CLOSE_PAREN = re.compile(r"\)")
+_RE_COLNAME = re.compile(r"(?:[a-zA-Z_]+\.)?([a-zA-Z_][a-zA-Z0-9_]*)")
+# Tokens estructurales del SELECT: literales entre comillas (cierre opcional), paréntesis o comas
+_RE_SELECT_TOKEN = re.compile(r"'[^']*'?|\"[^\"]*\"?|[(),]")
+_RE_WHITESPACE = re.compile(r"\s+")
+# Caracteres no permitidos en nombres de archivo de exportación (\w = alfanumérico Unicode o _)
+_RE_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w \-]")
+# Timestamps ISO 8601: fecha y hora completas (se recortan sin parsear) y año inicial
+_RE_ISO_DATETIME = re.compile(r"([0-9]{4}-[0-9]{2}-[0-9]{2})[T ]([0-9]{2}:[0-9]{2}:[0-9]{2})")
+_RE_ISO_YEAR = re.compile(r"[0-9]{4}")
+# Caracteres de tablas renderizadas: bordes Unicode (inicio de tabla) y cualquier línea de tabla
+_TABLE_BOX_CHARS = "┃┏┡"
+_RE_TABLE_BOX_CHARS = re.compile(f"[{_TABLE_BOX_CHARS}]")
+_RE_TABLE_LINE_CHARS = re.compile(r"[|┃┏┡─]")
+
+# Análisis automático por (respuesta, sql, pregunta): el mismo resultado se vuelve a mostrar
+# (cache hits, re-ejecuciones). La clave es la respuesta completa, no una muestra de filas.
+_ANALYSIS_CACHE_MAX_ENTRIES = 32
+_analysis_cache: "OrderedDict[tuple[str, str | None, str], str]" = OrderedDict()
+
+# Intervalo mínimo entre renders del streaming (los chunks de análisis llegan cada pocos ms)
+_STREAM_RENDER_INTERVAL_SECONDS = 0.1
+
+# Lexer y tema de resaltado SQL compartidos (evita resolverlos por nombre en cada render)
+_SQL_LEXER = SqlLexer()
+_SQL_THEME = Syntax.get_theme("monokai")
+
 
 class StreamingDisplay:
     """Maneja el display de streaming en tiempo real."""
@@ -48,11 +110,17 @@ class StreamingDisplay:
         self.config = config or {}
         self.sql = None
         self.status = "Iniciando..."
-        self.data = None
-        self.analysis = ""
+        self.data = None  # también calcula _data_display
+        # Chunks de análisis; se unen al leer `analysis` (evita concatenar O(n²))
+        self._analysis_parts: list[str] = []
         self.error = None
         self.layout = None
         self.live = None
+        self._last_render_monotonic = 0.0
+        # Paneles cacheados por sección: nombre -> (contenido con que se construyó, Panel)
+        self._panels: dict[str, tuple[Any, Panel]] = {}
+        # Estructura (sección, tamaño) del layout actual; si no cambia se reutiliza el árbol
+        self._layout_key: tuple[tuple[str, int], ...] | None = None
     
     def update(self, chunk_info: dict):
         """Actualiza el display con información del chunk."""
@@ -71,96 +139,141 @@ class StreamingDisplay:
         elif chunk_type == "analysis":
             # Acumular análisis (puede venir en múltiples chunks)
             if content:
-                if self.analysis:
-                    self.analysis += content
-                else:
-                    self.analysis = content
+                self._analysis_parts.append(content)
             self.status = "[yellow]Generando análisis...[/yellow]"
         elif chunk_type == "error":
             self.error = content
             self.status = "[red]Error[/red]"
         
-        # Actualizar layout si está activo
+        # Live reconstruye el layout en cada repintado (get_renderable), así su auto-refresh
+        # siempre muestra el último estado; aquí solo se fuerza un repintado inmediato, y las
+        # ráfagas de chunks se coalescen (los errores siempre se muestran).
         if self.live:
-            self._render()
+            now = time.monotonic()
+            if chunk_type != "error" and now - self._last_render_monotonic < _STREAM_RENDER_INTERVAL_SECONDS:
+                return
+            self._last_render_monotonic = now
+            self.live.refresh()
+    
+    @property
+    def data(self) -> str | None:
+        """Datos recibidos (texto de la respuesta)."""
+        return self._data
+
+    @data.setter
+    def data(self, value: str | None) -> None:
+        # La vista truncada se calcula una vez por cambio, no en cada render
+        self._data = value
+        self._data_display = value[:500] + "..." if value and len(value) > 500 else (value or "Esperando datos...")
+    
+    @property
+    def analysis(self) -> str:
+        """Análisis acumulado hasta el momento."""
+        # Se lee desde el hilo de refresco de Live: solo se unen las partes ya vistas, así
+        # un append concurrente queda al final en lugar de perderse.
+        parts = self._analysis_parts
+        count = len(parts)
+        if count > 1:
+            parts[:count] = ["".join(parts[:count])]
+        return parts[0] if parts else ""
+    
+    def _cached_panel(self, name: str, content: Any, build) -> Panel:
+        """Retorna el Panel de la sección, reconstruyéndolo solo si cambió su contenido."""
+        cached = self._panels.get(name)
+        if cached is not None and cached[0] == content:
+            return cached[1]
+        panel = build()
+        self._panels[name] = (content, panel)
+        return panel
     
     def _render(self) -> Layout:
-        """Renderiza el layout actual."""
-        layout = Layout()
-        
+        """Renderiza el layout actual (solo reconstruye las secciones que cambiaron)."""
         simple_mode = self.config.get("simple_mode", False)
         show_sql = self.config.get("show_sql", True)
         show_thinking = self.config.get("show_thinking", True)
         
-        # Sección de SQL
+        # Sección de SQL (el Syntax se cachea con el SQL: evita re-lexear con Pygments)
         sql_section = None
         if not simple_mode and show_sql:
-            sql_section = Panel(
-                Syntax(self.sql, "sql", theme="monokai", line_numbers=False) if self.sql 
+            sql = self.sql
+            sql_section = self._cached_panel("sql", sql, lambda: Panel(
+                Syntax(sql, _SQL_LEXER, theme=_SQL_THEME, line_numbers=False) if sql 
                 else Text("Generando SQL...", style="dim"),
                 title="[bold cyan]SQL[/bold cyan]",
                 border_style="cyan",
                 padding=(0, 1)
-            )
+            ))
         
         # Sección de estado
-        status_section = Panel(
-            Text(self.status, style="white"),
+        status = self.status
+        status_section = self._cached_panel("status", status, lambda: Panel(
+            Text(status, style="white"),
             title="[bold]Estado[/bold]",
             border_style="blue",
             padding=(0, 1)
-        )
+        ))
         
         # Sección de datos
-        data_section = Panel(
-            Text(self.data[:500] + "..." if self.data and len(self.data) > 500 else (self.data or "Esperando datos..."), 
-                 style="white"),
+        data_preview = self._data_display
+        data_section = self._cached_panel("data", data_preview, lambda: Panel(
+            Text(data_preview, style="white"),
             title="[bold green]Datos[/bold green]",
             border_style="green",
             padding=(0, 1)
-        )
+        ))
         
         # Sección de análisis
         analysis_section = None
         if not simple_mode and show_thinking:
-            analysis_section = Panel(
-                Text(self.analysis or "Generando análisis...", style="white"),
+            analysis = self.analysis
+            analysis_section = self._cached_panel("analysis", analysis, lambda: Panel(
+                Text(analysis or "Generando análisis...", style="white"),
                 title="[bold yellow]Análisis[/bold yellow]",
                 border_style="yellow",
                 padding=(0, 1)
-            )
+            ))
         
         # Sección de error si existe
         error_section = None
         if self.error:
-            error_section = Panel(
-                Text(self.error, style="red"),
+            error = self.error
+            error_section = self._cached_panel("error", error, lambda: Panel(
+                Text(error, style="red"),
                 title="[bold red]Error[/bold red]",
                 border_style="red",
                 padding=(0, 1)
-            )
-
-        # Construir layout dinámicamente
-        layout_components = []
-        if sql_section: layout_components.append(Layout(sql_section, size=8))
-        layout_components.append(Layout(status_section, size=3))
-        layout_components.append(Layout(data_section, size=6))
-        if analysis_section: layout_components.append(Layout(analysis_section, size=6 if error_section else 8))
-        if error_section: layout_components.append(Layout(error_section, size=4))
-        
-        layout.split_column(*layout_components)
+            ))
+
+        # Secciones visibles con su tamaño
+        sections = []
+        if sql_section: sections.append(("sql", sql_section, 8))
+        sections.append(("status", status_section, 3))
+        sections.append(("data", data_section, 6))
+        if analysis_section: sections.append(("analysis", analysis_section, 6 if error_section else 8))
+        if error_section: sections.append(("error", error_section, 4))
+        
+        # Misma estructura: actualizar las hojas del árbol existente en lugar de reconstruirlo
+        layout_key = tuple((name, size) for name, _, size in sections)
+        if self.layout is not None and layout_key == self._layout_key:
+            for name, section, _ in sections:
+                self.layout[name].update(section)
+            return self.layout
         
+        layout = Layout()
+        layout.split_column(*(Layout(section, name=name, size=size) for name, section, size in sections))
+        self.layout = layout
+        self._layout_key = layout_key
         return layout
     
     def start(self):
         """Inicia el display en modo live."""
-        self.layout = self._render()
-        self.live = Live(self.layout, console=console, refresh_per_second=4)
+        self.live = Live(console=console, refresh_per_second=4, get_renderable=self._render)
         self.live.start()
     
     def stop(self):
         """Detiene el display live."""
         if self.live:
+            # Live.stop repinta una última vez con get_renderable (incluye el último chunk)
             self.live.stop()
             self.live = None
 
@@ -181,9 +294,47 @@ def _display_streaming_response(question: str, config: dict[str, Any] = None):
     return display
 
 
+def _split_select_clause(select_clause: str) -> list[str]:
+    """
+    Divide la cláusula SELECT por comas de nivel superior.
+
+    Recorre solo los tokens estructurales (comillas, paréntesis, comas), registra las
+    comas de nivel superior y corta la cláusula por esas posiciones.
+
+    Args:
+        select_clause: Texto entre SELECT y FROM
+
+    Returns:
+        Lista de expresiones de columna (sin espacios alrededor)
+    """
+    bounds = [0]
+    paren_depth = 0
+
+    for match in _RE_SELECT_TOKEN.finditer(select_clause):
+        token = match.group()
+        if token == ',':
+            if paren_depth == 0:
+                bounds.append(match.end())
+        elif token == '(':
+            paren_depth += 1
+        elif token == ')':
+            paren_depth -= 1
+    bounds.append(len(select_clause) + 1)
+
+    columns = []
+    for start, end in zip(bounds, bounds[1:]):
+        col = select_clause[start:end - 1].strip()
+        if col:
+            columns.append(col)
+    return columns
+
+
 def _extract_column_names_from_sql(sql: str, num_cols: int) -> list[str] | None:
     """
     Extrae nombres de columnas del SQL generado.
+
+    El resultado se memoiza por (sql, num_cols): el mismo SQL se re-renderiza
+    (re-display, export + print) y el análisis con regex no cambia.
     
     Args:
         sql: Query SQL
@@ -194,59 +345,31 @@ def _extract_column_names_from_sql(sql: str, num_cols: int) -> list[str] | None:
     """
     if not sql:
         return None
-    
+    headers = _extract_column_names_cached(sql, num_cols)
+    return list(headers) if headers is not None else None
+
+
+@lru_cache(maxsize=256)
+def _extract_column_names_cached(sql: str, num_cols: int) -> tuple[str, ...] | None:
+    """Implementación memoizada de _extract_column_names_from_sql (retorna tupla inmutable)."""
     try:
-        import re
         sql_clean = sql.strip()
         
         # Buscar SELECT ... FROM (puede haber WITH antes)
         # Remover comentarios y normalizar espacios
-        sql_clean = re.sub(r'--.*?$', '', sql_clean, flags=re.MULTILINE)
-        sql_clean = re.sub(r'/\*.*?\*/', '', sql_clean, flags=re.DOTALL)
+        sql_clean = _RE_LINE_COMMENT.sub('', sql_clean)
+        sql_clean = _RE_BLOCK_COMMENT.sub('', sql_clean)
         sql_clean = ' '.join(sql_clean.split())
         
         # Buscar SELECT ... FROM (puede estar después de WITH)
-        select_match = re.search(r'SELECT\s+(.+?)\s+FROM', sql_clean, re.DOTALL | re.IGNORECASE)
+        select_match = _RE_SELECT_FROM.search(sql_clean)
         if not select_match:
             return None
         
         select_clause = select_match.group(1).strip()
         
         # Dividir por comas, pero respetar paréntesis y funciones
-        columns = []
-        current_col = ""
-        paren_depth = 0
-        in_quotes = False
-        quote_char = None
-        
-        for char in select_clause:
-            if char in ("'", '"') and not in_quotes:
-                in_quotes = True
-                quote_char = char
-                current_col += char
-            elif char == quote_char and in_quotes:
-                in_quotes = False
-                quote_char = None
-                current_col += char
-            elif not in_quotes:
-                if char == '(':
-                    paren_depth += 1
-                    current_col += char
-                elif char == ')':
-                    paren_depth -= 1
-                    current_col += char
-                elif char == ',' and paren_depth == 0:
-                    if current_col.strip():
-                        columns.append(current_col.strip())
-                    current_col = ""
-                else:
-                    current_col += char
-            else:
-                current_col += char
-        
-        # Agregar última columna
-        if current_col.strip():
-            columns.append(current_col.strip())
+        columns = _split_select_clause(select_clause)
         
         # Extraer nombres de columnas (después de AS o el nombre de la columna)
         headers = []
@@ -254,7 +377,7 @@ def _extract_column_names_from_sql(sql: str, num_cols: int) -> list[str] | None:
             col_clean = col.strip()
             
             # Buscar alias (AS nombre) - puede estar al final
-            as_match = re.search(r'\bAS\s+["\']?([a-zA-Z_][a-zA-Z0-9_]*)["\']?', col_clean, re.IGNORECASE)
+            as_match = _RE_AS_ALIAS.search(col_clean)
             if as_match:
                 alias = as_match.group(1)
                 # Convertir snake_case a Title Case
@@ -263,27 +386,18 @@ def _extract_column_names_from_sql(sql: str, num_cols: int) -> list[str] | None:
                 continue
             
             # Si es una función agregada, usar nombre descriptivo
-            if re.match(r'SUM\s*\(', col_clean, re.IGNORECASE):
-                # Intentar extraer nombre de columna dentro de la función
-                inner_match = re.search(
-                    r'SUM\s*\(\s*(?:[a-zA-Z_]+\.)?([a-zA-Z_]+)',
-                    col_clean,
-                    re.IGNORECASE,
-                )
-                if inner_match:
-                    col_name = inner_match.group(1)
+            kind_match = _RE_COL_KIND.match(col_clean)
+            agg = kind_match.group("agg").upper() if kind_match and kind_match.group("agg") else None
+            if agg == "SUM":
+                # Nombre de columna dentro de la función, si lo hay
+                col_name = kind_match.group("inner")
+                if col_name:
                     headers.append(f"Total {col_name.replace('_', ' ').title()}")
                 else:
                     headers.append("Total")
-            elif re.match(r'COUNT\s*\(', col_clean, re.IGNORECASE):
-                headers.append("Cantidad")
-            elif re.match(r'AVG\s*\(', col_clean, re.IGNORECASE):
-                headers.append("Promedio")
-            elif re.match(r'MAX\s*\(', col_clean, re.IGNORECASE):
-                headers.append("Máximo")
-            elif re.match(r'MIN\s*\(', col_clean, re.IGNORECASE):
-                headers.append("Mínimo")
-            elif re.match(r'DATE_TRUNC|TO_CHAR|EXTRACT', col_clean, re.IGNORECASE):
+            elif agg:
+                headers.append(_AGG_HEADERS[agg])
+            elif kind_match:
                 # Funciones de fecha
                 if 'month' in col_clean.lower():
                     headers.append("Mes")
@@ -296,11 +410,11 @@ def _extract_column_names_from_sql(sql: str, num_cols: int) -> list[str] | None:
             else:
                 # Extraer nombre de columna o tabla.columna
                 # Remover funciones y paréntesis para encontrar el nombre base
-                col_clean_no_func = re.sub(r'[A-Z_]+\s*\(', '', col_clean)
-                col_clean_no_func = re.sub(r'\)', '', col_clean_no_func)
+                col_clean_no_func = _RE_FUNC_OPEN.sub('', col_clean)
+                col_clean_no_func = _RE_CLOSE_PAREN.sub('', col_clean_no_func)
                 
                 # Buscar tabla.columna o solo columna
-                col_name_match = re.search(r'(?:[a-zA-Z_]+\.)?([a-zA-Z_][a-zA-Z0-9_]*)', col_clean_no_func)
+                col_name_match = _RE_COLNAME.search(col_clean_no_func)
                 if col_name_match:
                     col_name = col_name_match.group(1)
                     header = col_name.replace('_', ' ').title()
@@ -310,7 +424,7 @@ def _extract_column_names_from_sql(sql: str, num_cols: int) -> list[str] | None:
         
         # Si tenemos suficientes headers válidos, retornarlos
         if len(headers) == num_cols and all(h for h in headers):
-            return headers
+            return tuple(headers)
         
         return None
         
@@ -329,23 +443,16 @@ def _export_results(data: str, sql: str | None, export_format: str, question: st
         question: Pregunta original (para nombre de archivo)
     """
     try:
-        from datetime import datetime
-        
         # Generar nombre de archivo
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_question = "".join(c for c in question[:30] if c.isalnum() or c in (" ", "-", "_")).strip()
-        safe_question = safe_question.replace(" ", "_")
+        safe_question = _RE_UNSAFE_FILENAME_CHARS.sub("", question[:30]).strip().replace(" ", "_")
         
         if export_format == "csv":
             filename = f"query_{safe_question}_{timestamp}.csv"
+            # Por ahora se exporta como texto; el contenido se arma completo y se escribe una vez
+            sql_line = f"SQL: {sql}\n\n" if sql else ""
             with open(filename, "w", encoding="utf-8") as f:
-                # Si hay SQL, ejecutarlo directamente para obtener datos estructurados
-                # Por ahora, exportar como texto
-                f.write(f"Query: {question}\n")
-                if sql:
-                    f.write(f"SQL: {sql}\n\n")
-                f.write("Resultados:\n")
-                f.write(data)
+                f.write(f"Query: {question}\n{sql_line}Resultados:\n{data}")
             console.print(f"[bold green]✓ Resultados exportados a:[/bold green] {filename}")
         
         elif export_format == "json":
@@ -356,8 +463,8 @@ def _export_results(data: str, sql: str | None, export_format: str, question: st
                 "timestamp": datetime.now().isoformat(),
                 "results": data,
             }
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False)
+            with open(filename, "wb") as f:
+                f.write(orjson.dumps(export_data, option=orjson.OPT_INDENT_2))
             console.print(f"[bold green]✓ Resultados exportados a:[/bold green] {filename}")
         
         elif export_format == "excel":
@@ -366,9 +473,20 @@ def _export_results(data: str, sql: str | None, export_format: str, question: st
                 import pandas as pd
                 filename = f"query_{safe_question}_{timestamp}.xlsx"
                 
-                # Intentar parsear datos como DataFrame si es posible
-                # Por ahora, crear DataFrame simple con la respuesta
-                df = pd.DataFrame({"Resultado": [data]})
+                # Filas estructuradas (lista de tuplas/listas) -> una columna por campo;
+                # si la respuesta no es tabular, una sola celda con el texto
+                try:
+                    rows = _parse_structured_response(data.strip())
+                except (ValueError, SyntaxError):
+                    rows = None
+                if isinstance(rows, list) and rows and all(isinstance(row, (tuple, list)) for row in rows):
+                    df = pd.DataFrame(rows)
+                    num_cols = len(rows[0])
+                    headers = (_extract_column_names_from_sql(sql, num_cols) if sql else None) or _infer_column_headers(rows, num_cols)
+                    if len(headers) == len(df.columns):
+                        df.columns = headers
+                else:
+                    df = pd.DataFrame({"Resultado": [data]})
                 df.to_excel(filename, index=False)
                 console.print(f"[bold green]✓ Resultados exportados a:[/bold green] {filename}")
             except ImportError:
@@ -383,6 +501,52 @@ def _export_results(data: str, sql: str | None, export_format: str, question: st
         logger.error(f"Error en exportación: {e}")
 
 
+def _looks_structured(text: str) -> bool:
+    """Indica si el texto (sin espacios alrededor) tiene forma de lista o diccionario."""
+    return text[:1] in ("[", "{") and text[-1:] in ("]", "}")
+
+
+def _parse_structured_response(text: str) -> Any:
+    """
+    Parsea una respuesta con forma de lista/dict (JSON o literal de Python).
+
+    Prueba primero orjson (en C); si la respuesta no contiene strings, convierte
+    tuplas a listas y reintenta. `ast.literal_eval` queda solo como fallback.
+
+    Args:
+        text: Respuesta ya normalizada (sin espacios alrededor)
+
+    Returns:
+        Estructura parseada
+
+    Raises:
+        ValueError, SyntaxError: Si la respuesta no es una estructura válida
+    """
+    if not _looks_structured(text):
+        raise ValueError("La respuesta no es una lista ni un diccionario")
+
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+    # Sin comillas los paréntesis solo pueden ser tuplas, no contenido de strings
+    if "'" not in text and '"' not in text:
+        try:
+            return orjson.loads(text.translate(_TUPLES_TO_LISTS))
+        except orjson.JSONDecodeError:
+            pass
+
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        if not (text.startswith("[") and "\n" in text):
+            raise
+    # Limpiar saltos de línea y espacios extras, manteniendo comas y paréntesis
+    cleaned = _RE_WHITESPACE.sub(' ', text)
+    cleaned = cleaned.replace(' ,', ',').replace(', ', ',')
+    return ast.literal_eval(cleaned)
+
+
 def _infer_column_headers(data: list, num_cols: int) -> list[str]:
     """
     Infiere nombres de columnas más descriptivos basándose en los datos.
@@ -398,30 +562,42 @@ def _infer_column_headers(data: list, num_cols: int) -> list[str]:
         return [f"Columna {i+1}" for i in range(num_cols)]
     
     # Analizar tipos de datos en cada columna para inferir nombres
+    # Transponer la muestra una vez; el relleno None de filas cortas se descarta igual que los NULL
+    sample_columns = list(zip_longest(*data[:10]))
     column_types = []
     for col_idx in range(num_cols):
-        sample_values = [row[col_idx] for row in data[:10] if col_idx < len(row) and row[col_idx] is not None]
+        # Más allá de la 4ta columna el nombre no depende de los datos
+        if col_idx > 3:
+            column_types.append(f"Columna {col_idx + 1}")
+            continue
+
+        sample_values = [val for val in sample_columns[col_idx] if val is not None] if col_idx < len(sample_columns) else []
         
         if not sample_values:
             column_types.append(f"Columna {col_idx + 1}")
             continue
         
-        # Detectar tipo de dato
-        is_numeric = all(
-            isinstance(val, (int, float)) or 
-            (isinstance(val, str) and val.replace('.', '').replace('-', '').replace(',', '').isdigit())
-            for val in sample_values
-        )
-        is_id = all(
-            isinstance(val, int) and val > 0 and val < 100000
-            for val in sample_values
-        ) and len(sample_values) > 0 and is_numeric
-        
-        is_large_number = any(
-            (isinstance(val, (int, float)) and val > 1000) or
-            (isinstance(val, str) and val.replace(',', '').replace('.', '').isdigit() and int(val.replace(',', '').replace('.', '')) > 1000)
-            for val in sample_values
-        )
+        # Detectar tipo de dato: una sola pasada por valor calcula los tres flags
+        is_numeric = True
+        is_id = True
+        is_large_number = False
+        for val in sample_values:
+            if isinstance(val, (int, float)):
+                if is_id and not (isinstance(val, int) and 0 < val < 100000):
+                    is_id = False
+                if val > 1000:
+                    is_large_number = True
+                continue
+            is_id = False
+            if isinstance(val, str):
+                if not val.translate(_STRIP_NUMERIC_SEPARATORS).isdigit():
+                    is_numeric = False
+                digits = val.translate(_STRIP_THOUSANDS_SEPARATORS)
+                if not is_large_number and digits.isdigit() and int(digits) > 1000:
+                    is_large_number = True
+            else:
+                is_numeric = False
+        is_id = is_id and is_numeric
         
         # Inferir nombre basado en posición, tipo y contexto
         if col_idx == 0:
@@ -460,6 +636,40 @@ def _infer_column_headers(data: list, num_cols: int) -> list[str]:
     return column_types
 
 
+def _format_int(value: int) -> str:
+    """Entero con separadores de miles."""
+    return f"{value:,}"
+
+
+def _format_float(value: float) -> str:
+    """Decimales con máximo 2 dígitos, sin ceros innecesarios (inf/nan tal cual)."""
+    if not math.isfinite(value):
+        return str(value)
+    if value == int(value):
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+
+def _format_decimal(value: Decimal) -> str:
+    """Decimal (de SQL) formateado como float; NaN/Infinity o fuera de rango de float, tal cual."""
+    decimal_val = float(value) if value.is_finite() else math.nan
+    if not math.isfinite(decimal_val):
+        return str(value)
+    if decimal_val == int(decimal_val):
+        return f"{int(decimal_val):,}"
+    return f"{decimal_val:,.2f}"
+
+
+# Despacho por tipo exacto (un lookup por celda en el caso común)
+_VALUE_FORMATTERS: dict[type, Callable[[Any], str]] = {
+    type(None): lambda _: "N/A",
+    str: str,
+    int: _format_int,
+    float: _format_float,
+    Decimal: _format_decimal,
+}
+
+
 def _format_value(value: Any) -> str:
     """
     Formatea un valor para mostrar en la tabla.
@@ -470,32 +680,47 @@ def _format_value(value: Any) -> str:
     Returns:
         String formateado
     """
-    if value is None:
-        return "N/A"
+    formatter = _VALUE_FORMATTERS.get(type(value))
+    if formatter is not None:
+        return formatter(value)
     
-    # Formatear números con separadores de miles
-    if isinstance(value, (int, float)):
-        if isinstance(value, float):
-            # Formatear decimales (máximo 2 decimales, sin ceros innecesarios)
-            if value == int(value):
-                return f"{int(value):,}"
-            return f"{value:,.2f}"
-        else:
-            return f"{value:,}"
-    
-    # Formatear Decimal (de SQL)
-    if hasattr(value, '__class__') and 'Decimal' in str(type(value)):
-        try:
-            decimal_val = float(value)
-            if decimal_val == int(decimal_val):
-                return f"{int(decimal_val):,}"
-            return f"{decimal_val:,.2f}"
-        except:
-            return str(value)
+    # Subclases (bool, IntEnum, Decimal, ...)
+    if isinstance(value, float):
+        return _format_float(value)
+    if isinstance(value, int):
+        return _format_int(value)
+    if isinstance(value, Decimal):
+        return _format_decimal(value)
     
     return str(value)
 
 
+def _cached_automatic_analysis(response: str, data: list, sql: str | None = None, question: str = "") -> str:
+    """
+    Retorna el análisis automático de `data`, reutilizándolo si la respuesta ya se analizó.
+
+    Args:
+        response: Respuesta original del agente (de la que se parseó `data`)
+        data: Filas parseadas de la respuesta
+        sql: SQL generado (opcional)
+        question: Pregunta original (opcional)
+
+    Returns:
+        Análisis en lenguaje natural
+    """
+    key = (response, sql, question)
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        _analysis_cache.move_to_end(key)
+        return cached
+
+    analysis = _generate_automatic_analysis(data, sql, question)
+    _analysis_cache[key] = analysis
+    if len(_analysis_cache) > _ANALYSIS_CACHE_MAX_ENTRIES:
+        _analysis_cache.popitem(last=False)
+    return analysis
+
+
 def _generate_automatic_analysis(data: list, sql: str | None = None, question: str = "") -> str:
     """
     Genera análisis automático basado en los datos.
@@ -520,19 +745,35 @@ def _generate_automatic_analysis(data: list, sql: str | None = None, question: s
     # Resumen general
     analysis_parts.append(f"Se encontraron {num_rows} registros.")
     
+    # Filas con segunda columna numérica en 0 (se cuentan en la misma pasada)
+    zero_col2 = 0
+    
     # Análisis de columnas numéricas
     if num_cols > 1:
         # Analizar segunda columna (típicamente cantidad/total)
         if num_cols >= 2:
-            col2_values = [row[1] for row in data if len(row) > 1 and isinstance(row[1], (int, float))]
-            if col2_values:
-                total_col2 = sum(col2_values)
-                max_col2 = max(col2_values)
-                min_col2 = min(col2_values)
-                avg_col2 = total_col2 / len(col2_values) if col2_values else 0
-                
-                # Identificar el registro con el valor máximo
-                max_row = next((row for row in data if len(row) > 1 and row[1] == max_col2), None)
+            # Una sola pasada: total, conteo, mínimo, máximo (con su fila) y filas en cero
+            total_col2 = 0
+            count_col2 = 0
+            max_col2 = min_col2 = None
+            max_row = None
+            for row in data:
+                if len(row) <= 1:
+                    continue
+                value = row[1]
+                if not isinstance(value, (int, float)):
+                    continue
+                total_col2 += value
+                count_col2 += 1
+                if value == 0:
+                    zero_col2 += 1
+                if max_col2 is None or value > max_col2:
+                    max_col2 = value
+                    max_row = row
+                if min_col2 is None or value < min_col2:
+                    min_col2 = value
+            if count_col2:
+                avg_col2 = total_col2 / count_col2
                 max_name = max_row[0] if max_row and len(max_row) > 0 else "N/A"
                 
                 analysis_parts.append(
@@ -549,11 +790,11 @@ def _generate_automatic_analysis(data: list, sql: str | None = None, question: s
                 avg_col3 = total_col3 / len(col3_values) if col3_values else 0
                 
                 # Verificar si hay productos con stock bajo (menor al promedio)
-                low_stock = [row for row in data if len(row) > 2 and isinstance(row[2], (int, float)) and row[2] < avg_col3]
+                low_stock = sum(1 for value in col3_values if value < avg_col3)
                 
                 if low_stock:
                     analysis_parts.append(
-                        f"Hay {len(low_stock)} productos con stock por debajo del promedio ({_format_value(avg_col3)}). "
+                        f"Hay {low_stock} productos con stock por debajo del promedio ({_format_value(avg_col3)}). "
                         f"Se recomienda revisar estos productos para evitar desabastecimiento."
                     )
                 else:
@@ -566,10 +807,9 @@ def _generate_automatic_analysis(data: list, sql: str | None = None, question: s
     if "vendidos" in question.lower() or "ventas" in question.lower():
         if num_cols >= 2:
             # Verificar si hay productos con 0 ventas
-            zero_sales = [row for row in data if len(row) > 1 and isinstance(row[1], (int, float)) and row[1] == 0]
-            if zero_sales:
+            if zero_col2:
                 analysis_parts.append(
-                    f"Nota: {len(zero_sales)} productos no tienen ventas registradas. "
+                    f"Nota: {zero_col2} productos no tienen ventas registradas. "
                     f"Esto puede indicar productos nuevos o con problemas de demanda."
                 )
     
@@ -583,38 +823,107 @@ def _generate_automatic_analysis(data: list, sql: str | None = None, question: s
     return " ".join(analysis_parts)
 
 
+def _split_table_line(line: str) -> list[str] | None:
+    """
+    Divide una línea de tabla en texto (separada por | o tabs) en celdas no vacías.
+
+    Args:
+        line: Línea de la respuesta
+
+    Returns:
+        Celdas sin espacios alrededor, o None si la línea no tiene separadores
+    """
+    if "|" in line:
+        sep = "|"
+    elif "\t" in line:
+        sep = "\t"
+    else:
+        return None
+    return list(filter(None, map(str.strip, line.split(sep))))
+
+
+def _truncate(text: str, max_len: int, suffix: str = "...") -> str:
+    """Recorta `text` a `max_len` caracteres (incluido `suffix`) si es más largo."""
+    return text if len(text) <= max_len else text[:max_len - len(suffix)] + suffix
+
+
+def _format_timestamp(timestamp: str) -> str:
+    """
+    Formatea un timestamp ISO 8601 como 'YYYY-MM-DD HH:MM:SS' para mostrar.
+
+    Los timestamps completos (los que escribe el sistema) se recortan sin parsear;
+    el resto pasa por datetime.fromisoformat solo si empieza con un año, para no
+    levantar excepciones con textos que no son fechas.
+
+    Args:
+        timestamp: Timestamp ISO 8601
+
+    Returns:
+        Timestamp formateado, o el original si no es válido
+    """
+    match = _RE_ISO_DATETIME.match(timestamp)
+    if match:
+        return f"{match[1]} {match[2]}"
+    if not _RE_ISO_YEAR.match(timestamp):
+        return timestamp
+    try:
+        return datetime.fromisoformat(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return timestamp
+
+
+def _text_after_table(lines: list[str]) -> str:
+    """
+    Une las líneas posteriores a una tabla descartando las que parecen ser parte de ella.
+
+    Args:
+        lines: Líneas de la respuesta después de la tabla
+
+    Returns:
+        Texto analítico (sin espacios alrededor; vacío si no hay)
+    """
+    # Caso común: ninguna línea tiene caracteres de tabla, basta una búsqueda sobre el texto unido
+    text = "\n".join(lines)
+    if not _RE_TABLE_LINE_CHARS.search(text):
+        return text.strip()
+    return "\n".join(filterfalse(_RE_TABLE_LINE_CHARS.search, lines)).strip()
+
+
 def _format_query_result(response: str, output_format: str = "table", sql_generated: str | None = None, question: str = "") -> None:
     """
     Formatea y muestra el resultado de una query.
 
+    Los bloques (tabla, análisis, texto) se emiten en un único console.print para
+    escribir la salida de una sola vez.
+
     Args:
         response: Respuesta del agente (puede contener datos tabulares, tuplas, listas)
         output_format: Formato de salida ('table' o 'json')
         sql_generated: SQL generado (opcional, para inferir nombres de columnas)
     """
-    # Intentar parsear como estructura de Python (tuplas, listas)
+    renderables = _query_result_renderables(response, output_format, sql_generated, question)
+    if renderables:
+        console.print(Group(*renderables))
+
+
+def _query_result_renderables(response: str, output_format: str, sql_generated: str | None, question: str) -> list[Any]:
+    """Construye los renderables de Rich para _format_query_result (sin imprimir)."""
+    # Formato JSON: se muestra la respuesta tal cual, sin detección de tablas ni análisis
+    if output_format == "json":
+        try:
+            # JSON parsea y re-indenta la respuesta en una sola pasada
+            return [JSON(response, indent=2, ensure_ascii=False)]
+        except ValueError:
+            # Si no es JSON válido, mostrar como texto
+            return [console.render_str(response)]
+    
+    renderables: list[Any] = []
+    normalized_response = response.strip()
+    
+    # Intentar parsear como estructura de Python (tuplas, listas); el texto plano
+    # (caso común) se descarta con un chequeo O(1) en lugar de levantar una excepción
     try:
-        import ast
-        import re
-        
-        # Normalizar respuesta: remover saltos de línea innecesarios dentro de listas/tuplas
-        normalized_response = response.strip()
-        
-        # Si la respuesta parece ser una lista de tuplas con saltos de línea, limpiarla
-        if normalized_response.startswith("[") and "\n" in normalized_response:
-            # Remover saltos de línea y espacios extras, pero mantener estructura
-            # Primero intentar parsear como está
-            try:
-                parsed_data = ast.literal_eval(normalized_response)
-            except (ValueError, SyntaxError):
-                # Si falla, limpiar saltos de línea y espacios extras
-                # Mantener comas y paréntesis importantes
-                cleaned = re.sub(r'\s+', ' ', normalized_response)
-                cleaned = cleaned.replace(' ,', ',').replace(', ', ',')
-                parsed_data = ast.literal_eval(cleaned)
-        else:
-            # Intentar evaluar como estructura de Python
-            parsed_data = ast.literal_eval(normalized_response)
+        parsed_data = _parse_structured_response(normalized_response) if _looks_structured(normalized_response) else None
         
         # Si es una lista de tuplas o lista de listas, formatear como tabla
         if isinstance(parsed_data, list) and len(parsed_data) > 0:
@@ -623,7 +932,7 @@ def _format_query_result(response: str, output_format: str = "table", sql_genera
                 table = Table(
                     show_header=True, 
                     header_style="bold cyan",
-                    box="rounded",
+                    box=box.ROUNDED,
                     show_lines=True,
                     padding=(0, 1),
                     border_style="bright_blue"
@@ -641,48 +950,63 @@ def _format_query_result(response: str, output_format: str = "table", sql_genera
                 if not headers:
                     headers = _infer_column_headers(parsed_data, num_cols)
                 
+                # Formatear cada valor apropiadamente
+                formatted_rows = [[_format_value(val) for val in row] for row in parsed_data]
+                fixed_widths = len(formatted_rows) > _FIXED_WIDTH_MIN_ROWS
+                width_sample = formatted_rows[:_WIDTH_SAMPLE_ROWS]
+                
                 # Agregar columnas con estilos apropiados
                 for i, header in enumerate(headers):
                     # Determinar alineación basada en el tipo de datos
                     sample_col_values = [row[i] for row in parsed_data[:5] if i < len(row)]
                     is_numeric_col = any(
                         isinstance(val, (int, float)) or 
-                        (isinstance(val, str) and val.replace('.', '').replace('-', '').replace(',', '').isdigit())
+                        (isinstance(val, str) and val.translate(_STRIP_NUMERIC_SEPARATORS).isdigit())
                         for val in sample_col_values
                     )
                     
                     justify = "right" if (i > 0 and is_numeric_col) else "left"
                     col_style = "bright_white" if is_numeric_col else "white"
                     
+                    # Tablas grandes: ancho fijo desde la muestra; celdas más largas se pliegan (fold)
+                    width = None
+                    if fixed_widths:
+                        width = max(
+                            12,
+                            cell_len(header),
+                            *(cell_len(row[i]) for row in width_sample if i < len(row)),
+                        )
+                    
                     table.add_column(
                         header, 
                         style=col_style,
                         justify=justify,
                         overflow="fold",
-                        min_width=12
+                        min_width=12,
+                        width=width,
                     )
                 
                 # Agregar filas con valores formateados
-                for row in parsed_data:
-                    # Formatear cada valor apropiadamente
-                    formatted_row = [_format_value(val) for val in row]
+                for formatted_row in formatted_rows:
                     table.add_row(*formatted_row)
                 
-                console.print(table)
+                renderables.append(table)
                 
                 # Generar análisis automático si no hay análisis en la respuesta
                 # Verificar si la respuesta original tiene texto analítico
+                # (str(parsed_data) recorre todos los datos: se evalúa al final)
+                response_lower = response.lower()
                 response_has_analysis = (
-                    len(response) > len(str(parsed_data)) + 50 or  # Respuesta es más larga que solo datos
                     not response.strip().startswith("[") or  # No empieza con lista
-                    "análisis" in response.lower() or
-                    "conclusión" in response.lower() or
-                    "insight" in response.lower()
+                    "análisis" in response_lower or
+                    "conclusión" in response_lower or
+                    "insight" in response_lower or
+                    len(response) > len(str(parsed_data)) + 50  # Respuesta es más larga que solo datos
                 )
                 
                 if not response_has_analysis:
                     # Generar análisis automático
-                    analysis = _generate_automatic_analysis(parsed_data, sql_generated, question)
+                    analysis = _cached_automatic_analysis(response, parsed_data, sql_generated, question)
                     if analysis:
                         panel = Panel(
                             Text(analysis, style="white"),
@@ -690,9 +1014,9 @@ def _format_query_result(response: str, output_format: str = "table", sql_genera
                             border_style="cyan",
                             padding=(1, 2)
                         )
-                        console.print(panel)
+                        renderables.append(panel)
                 
-                return
+                return renderables
             elif isinstance(parsed_data, dict):
                 # Es un diccionario, mostrar como tabla de clave-valor
                 table = Table(show_header=True, header_style="bold magenta")
@@ -700,140 +1024,91 @@ def _format_query_result(response: str, output_format: str = "table", sql_genera
                 table.add_column("Valor", style="white")
                 for key, value in parsed_data.items():
                     table.add_row(str(key), str(value))
-                console.print(table)
-                return
+                renderables.append(table)
+                return renderables
     except (ValueError, SyntaxError, AttributeError):
         # No es una estructura de Python válida, continuar con otros formatos
         pass
     
     # Definir lines aquí antes de usarla
-    lines = response.strip().split("\n")
+    lines = normalized_response.split("\n")
     
-    # Detectar formato tabular simple (filas con | o tabs)
-    if len(lines) > 2 and any("|" in line or "\t" in line for line in lines[:5]):
+    # Detectar formato tabular simple (filas con | o tabs): headers = primera línea con separadores
+    header_line = None
+    if len(lines) > 2:
+        header_line = next((i for i, line in enumerate(lines[:5]) if "|" in line or "\t" in line), None)
+    
+    if header_line is not None:
         # Parsear como tabla
         table = Table(show_header=True, header_style="bold magenta")
         
-        # Detectar headers (primera línea o línea con separadores)
-        header_line = None
-        for i, line in enumerate(lines[:10]):
-            if "|" in line or "\t" in line:
-                header_line = i
-                break
+        # Parsear headers
+        headers = _split_table_line(lines[header_line])
         
-        if header_line is not None:
-            # Parsear headers
-            if "|" in lines[header_line]:
-                headers = [h.strip() for h in lines[header_line].split("|") if h.strip()]
-            else:
-                headers = [h.strip() for h in lines[header_line].split("\t") if h.strip()]
-            
-            # Agregar columnas a la tabla
-            for header in headers:
-                table.add_column(header, style="cyan")
-            
-            # Agregar filas y encontrar el final de la tabla
-            table_end_idx = header_line
-            for line in lines[header_line + 1:]:
-                if "|" in line or "\t" in line:
-                    table_end_idx += 1
-                    if "|" in line:
-                        row = [cell.strip() for cell in line.split("|") if cell.strip()]
-                    else:
-                        row = [cell.strip() for cell in line.split("\t") if cell.strip()]
-                    
-                    # Asegurar que el número de columnas coincida
-                    if len(row) == len(headers):
-                        table.add_row(*row)
-                else:
-                    # Fin de la tabla
-                    break
-            
-            console.print(table)
+        # Agregar columnas a la tabla
+        for header in headers:
+            table.add_column(header, style="cyan")
+        
+        # Agregar filas y encontrar el final de la tabla
+        table_end_idx = header_line
+        for line in lines[header_line + 1:]:
+            row = _split_table_line(line)
+            if row is None:
+                # Fin de la tabla
+                break
+            table_end_idx += 1
             
-            # Detectar texto analítico después de la tabla
-            outro_text = "\n".join(lines[table_end_idx + 1:]).strip()
-            if outro_text and len(outro_text) > 20:
-                # Filtrar líneas que parecen ser parte de la tabla
-                outro_lines = [l for l in outro_text.split("\n") if not ("|" in l or "┃" in l or "┏" in l or "┡" in l or "─" in l)]
-                if outro_lines:
-                    analysis_text = "\n".join(outro_lines)
-                    panel = Panel(
-                        Text(analysis_text, style="white"),
-                        title="[bold cyan]Análisis[/bold cyan]",
-                        border_style="cyan",
-                        padding=(1, 2)
-                    )
-                    console.print(panel)
-            return
-    
-    # Detectar si hay texto analítico sin tabla
-    # Buscar bloques de texto analítico
-    # Nota: lines ya está definida arriba
-    has_table = False
-    analysis_text = []
-    table_start_idx = None
-    table_end_idx = None
-    
-    # Detectar si hay estructura tabular en la respuesta (con caracteres Unicode)
-    for i, line in enumerate(lines):
-        if "┃" in line or "┏" in line or "┡" in line:
-            if not has_table:
-                table_start_idx = i
-                has_table = True
-            table_end_idx = i
-    
-    # Si hay tabla Unicode, extraer texto antes y después
-    if has_table and table_start_idx is not None:
-        # Texto antes de la tabla (introducción)
-        intro_text = "\n".join(lines[:table_start_idx]).strip()
-        if intro_text and len(intro_text) > 20:
-            analysis_text.append(("intro", intro_text))
-        
-        # Texto después de la tabla (análisis)
-        if table_end_idx is not None:
-            outro_text = "\n".join(lines[table_end_idx + 1:]).strip()
-            if outro_text and len(outro_text) > 20:
-                # Filtrar líneas que parecen ser parte de la tabla
-                outro_lines = [l for l in outro_text.split("\n") if not ("|" in l or "┃" in l or "┏" in l or "┡" in l or "─" in l)]
-                if outro_lines:
-                    analysis_text.append(("analysis", "\n".join(outro_lines)))
-    else:
-        # No hay tabla, toda la respuesta puede ser análisis
-        full_text = response.strip()
-        if full_text and len(full_text) > 50:
-            analysis_text.append(("full", full_text))
-    
-    # Mostrar texto analítico si existe
-    for text_type, text_content in analysis_text:
-        if text_type == "intro":
-            console.print(f"\n[dim italic]{text_content}[/dim italic]\n")
-        elif text_type == "analysis":
-            # Mostrar análisis con estilo destacado
+            # Asegurar que el número de columnas coincida
+            if len(row) == len(headers):
+                table.add_row(*row)
+        
+        renderables.append(table)
+        
+        # Detectar texto analítico después de la tabla
+        analysis_text = _text_after_table(lines[table_end_idx + 1:])
+        if len(analysis_text) > 20:
             panel = Panel(
-                Text(text_content, style="white"),
+                Text(analysis_text, style="white"),
                 title="[bold cyan]Análisis[/bold cyan]",
                 border_style="cyan",
                 padding=(1, 2)
             )
-            console.print(panel)
-        elif text_type == "full":
-            # Si no hay tabla, mostrar como texto formateado
-            console.print(f"\n{text_content}\n")
+            renderables.append(panel)
+        return renderables
     
-    # Si no es tabular o formato es json, mostrar como está
-    if output_format == "json":
-        try:
-            # Intentar parsear como JSON si es posible
-            import json
-            json_data = json.loads(response)
-            console.print_json(json.dumps(json_data, indent=2, ensure_ascii=False))
-        except (json.JSONDecodeError, ValueError):
-            # Si no es JSON válido, mostrar como texto
-            console.print(response)
-    elif not has_table and not analysis_text:
-        # Si no hay tabla ni análisis detectado, mostrar respuesta completa
-        console.print(response)
+    # Detectar si hay estructura tabular en la respuesta (con caracteres Unicode):
+    # búsquedas sobre el texto completo y conversión del offset a índice de línea
+    first_box = _RE_TABLE_BOX_CHARS.search(normalized_response)
+    if first_box is None:
+        if len(normalized_response) > 50:
+            # No hay tabla: toda la respuesta es análisis, mostrar como texto formateado
+            renderables.append(console.render_str(f"\n{normalized_response}\n"))
+        else:
+            # Si no hay tabla ni análisis detectado, mostrar respuesta completa
+            renderables.append(console.render_str(response))
+        return renderables
+    
+    last_box_offset = max(normalized_response.rfind(char) for char in _TABLE_BOX_CHARS)
+    table_start_idx = normalized_response.count("\n", 0, first_box.start())
+    table_end_idx = normalized_response.count("\n", 0, last_box_offset)
+    
+    # Texto antes de la tabla (introducción)
+    intro_text = "\n".join(lines[:table_start_idx]).strip()
+    if len(intro_text) > 20:
+        renderables.append(console.render_str(f"\n[dim italic]{intro_text}[/dim italic]\n"))
+    
+    # Texto después de la tabla (análisis), con estilo destacado
+    outro_text = _text_after_table(lines[table_end_idx + 1:])
+    if len(outro_text) > 20:
+        panel = Panel(
+            Text(outro_text, style="white"),
+            title="[bold cyan]Análisis[/bold cyan]",
+            border_style="cyan",
+            padding=(1, 2)
+        )
+        renderables.append(panel)
+    
+    return renderables
 
 
 @click.group()
@@ -912,6 +1187,8 @@ def query(question: str, verbose: bool, explain: bool, stream: bool, limit: int
             # Si explain está activado, primero generar SQL y explicarlo
             # Nota: explain no funciona bien con streaming, así que lo desactivamos temporalmente
             sql_generated = None
+            # Resultado de la ejecución previa de explain (se reutiliza para no ejecutar dos veces)
+            result_preview = None
             if explain and not stream:
                 # Ejecutar en modo verbose para obtener SQL primero (sin streaming)
                 result_preview = execute_query(agent, question, return_metadata=True, stream=False)
@@ -951,6 +1228,8 @@ def query(question: str, verbose: bool, explain: bool, stream: bool, limit: int
                     except Exception as e:
                         display.stop()
                         raise e
+                elif isinstance(result_preview, dict):
+                    result = result_preview
                 else:
                     result = execute_query(agent, question, return_metadata=True, stream=False)
                 
@@ -964,7 +1243,7 @@ def query(question: str, verbose: bool, explain: bool, stream: bool, limit: int
                     # Mostrar SQL generado si está disponible y permitido por config
                     if sql_generated and not config.get("simple_mode") and config.get("show_sql"):
                         console.print("\n[bold cyan]SQL Generado:[/bold cyan]")
-                        syntax = Syntax(sql_generated, "sql", theme="monokai", line_numbers=False)
+                        syntax = Syntax(sql_generated, _SQL_LEXER, theme=_SQL_THEME, line_numbers=False)
                         console.print(syntax)
                         console.print()
                     
@@ -1021,7 +1300,10 @@ def query(question: str, verbose: bool, explain: bool, stream: bool, limit: int
                 # Pero si usamos flags nuevos, tal vez queramos metadata pero filtrada visualmente.
                 # Vamos a simplificar: si no hay stream, ejecutamos normal.
                 
-                response = execute_query(agent, question, stream=False)
+                if isinstance(result_preview, dict):
+                    response = result_preview.get("response", "")
+                else:
+                    response = execute_query(agent, question, stream=False)
                 console.print("[bold green]Respuesta:[/bold green]\n")
                 _format_query_result(response, output_format=format, sql_generated=None, question=question)
                 
@@ -1152,16 +1434,12 @@ def history(limit: int, clear: bool):
         for i, entry in enumerate(history_entries, 1):
             timestamp = entry.get("timestamp", "")
             if timestamp:
-                try:
-                    dt = datetime.fromisoformat(timestamp)
-                    timestamp = dt.strftime("%Y-%m-%d %H:%M:%S")
-                except:
-                    pass
+                timestamp = _format_timestamp(timestamp)
             
-            question = entry.get("question", "")[:47] + "..." if len(entry.get("question", "")) > 50 else entry.get("question", "")
+            question = _truncate(entry.get("question") or "", 50)
             success = "✓" if entry.get("success", True) else "✗"
             sql = entry.get("sql", "")
-            sql_display = sql[:27] + "..." if sql and len(sql) > 30 else (sql or "-")
+            sql_display = _truncate(sql, 30) if sql else "-"
             
             table.add_row(
                 str(i),
@@ -1242,15 +1520,16 @@ def stats(days: int, slow_threshold: float, clear: bool):
             model_table.add_column("Porcentaje", style="yellow")
             
             total_queries = stats_data['total_queries']
+            # Factor de porcentaje invariante: se calcula una vez fuera del loop
+            scale = (100.0 / total_queries) if total_queries > 0 else 0.0
             for model, count in stats_data['model_distribution'].items():
-                percentage = (count / total_queries * 100) if total_queries > 0 else 0
-                model_table.add_row(model or "N/A", str(count), f"{percentage:.1f}%")
+                model_table.add_row(model or "N/A", str(count), f"{count * scale:.1f}%")
             
             console.print(model_table)
             console.print()
         
         # Queries lentas
-        slow_queries = get_slow_queries(threshold_seconds=slow_threshold, limit=5) or []
+        slow_queries = get_slow_queries(threshold_seconds=slow_threshold, limit=5)
         if slow_queries:
             console.print(f"[bold yellow]Top 5 Queries Lentas (>={slow_threshold}s):[/bold yellow]\n")
             slow_table = Table(show_header=True, header_style="bold magenta")
@@ -1265,21 +1544,18 @@ def stats(days: int, slow_threshold: float, clear: bool):
                 if not sql:
                     continue
                 
-                # Crear key único basado en SQL y tiempo (para evitar duplicados exactos)
-                query_key = (sql[:100], query.get("execution_time", 0))
+                # Key único basado en SQL y tiempo (para evitar duplicados exactos); el
+                # sql_hash ya calculado al registrar la métrica evita recortar el SQL por fila
+                query_key = (query.get("sql_hash") or sql[:100], query.get("execution_time", 0))
                 if query_key in seen_queries:
                     continue
                 seen_queries.add(query_key)
                 
-                sql_preview = sql[:57] + "..." if len(sql) > 60 else sql
+                sql_preview = _truncate(sql, 60)
                 time_str = f"{query.get('execution_time', 0):.2f}s"
                 timestamp = query.get("timestamp", "")
                 if timestamp:
-                    try:
-                        dt = datetime.fromisoformat(timestamp)
-                        timestamp = dt.strftime("%Y-%m-%d %H:%M:%S")
-                    except:
-                        pass
+                    timestamp = _format_timestamp(timestamp)
                 
                 slow_table.add_row(sql_preview, time_str, timestamp)
             
@@ -1288,7 +1564,7 @@ def stats(days: int, slow_threshold: float, clear: bool):
                 console.print()
         
         # Queries fallidas recientes
-        failed_queries = get_failed_queries(limit=5) or []
+        failed_queries = get_failed_queries(limit=5)
         if failed_queries:
             console.print("[bold red]Queries Fallidas Recientes:[/bold red]\n")
             failed_table = Table(show_header=True, header_style="bold magenta")
@@ -1297,15 +1573,11 @@ def stats(days: int, slow_threshold: float, clear: bool):
             failed_table.add_column("Fecha", style="dim", width=20)
             
             for query in failed_queries:
-                sql_preview = query.get("sql", "")[:57] + "..." if len(query.get("sql", "")) > 60 else query.get("sql", "")
-                error = query.get("error_message", "Unknown")[:27] + "..." if len(query.get("error_message", "")) > 30 else query.get("error_message", "Unknown")
+                sql_preview = _truncate(query.get("sql") or "", 60)
+                error = _truncate(query.get("error_message") or "Unknown", 30)
                 timestamp = query.get("timestamp", "")
                 if timestamp:
-                    try:
-                        dt = datetime.fromisoformat(timestamp)
-                        timestamp = dt.strftime("%Y-%m-%d %H:%M:%S")
-                    except:
-                        pass
+                    timestamp = _format_timestamp(timestamp)
                 
                 failed_table.add_row(sql_preview, error, timestamp)
             
@@ -1327,7 +1599,7 @@ def stats(days: int, slow_threshold: float, clear: bool):
                 if not sql_preview:
                     continue
                 
-                sql_preview = sql_preview[:47] + "..." if len(sql_preview) > 50 else sql_preview
+                sql_preview = _truncate(sql_preview, 50)
                 count = str(pattern.get("count", 0))
                 avg_time = f"{pattern.get('avg_time', 0):.2f}s"
                 success_rate = f"{pattern.get('success_count', 0)}/{pattern.get('count', 0)}"
@@ -1356,7 +1628,7 @@ def validate_sql(sql: str):
         console.print(f"[bold blue]Validando SQL:[/bold blue]\n")
 
         # Mostrar SQL con syntax highlighting
-        syntax = Syntax(sql, "sql", theme="monokai", line_numbers=False)
+        syntax = Syntax(sql, _SQL_LEXER, theme=_SQL_THEME, line_numbers=False)
         console.print(syntax)
         console.print()
 
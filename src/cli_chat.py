@@ -5,7 +5,7 @@ import ast
 import hashlib
 import os
 import sys
-from typing import Any, Iterable, Sequence
+from typing import Any, Callable, Iterable, Sequence
 
 try:
     from prompt_toolkit import prompt as pt_prompt
@@ -15,6 +15,7 @@ except Exception:
     PT_AVAILABLE = False
 
 from dotenv import load_dotenv
+from rich.cells import cell_len
 from rich.console import Console, Group
 from rich.live import Live
 from rich.text import Text
@@ -22,9 +23,11 @@ from rich.panel import Panel
 from rich.prompt import Confirm, Prompt
 from rich.syntax import Syntax
 from rich.table import Table
+from pygments.lexers.sql import SqlLexer
 from sqlalchemy import text as sa_text
 from sqlalchemy.engine import Engine
 
+from src.agents.executor import semantic_cache_hit
 from src.agents.sql_agent import create_sql_agent, execute_query
 from src.schemas.database_schema import (
     get_schema_for_prompt,
@@ -44,6 +47,27 @@ from src.validators.sql_validator import SQLValidator
 
 load_dotenv()
 
+# Lexer y tema de resaltado SQL compartidos (evita resolverlos por nombre en cada render)
+_SQL_LEXER = SqlLexer()
+_SQL_THEME = Syntax.get_theme("monokai")
+
+
+def _fmt_int(value: int) -> str:
+    return f"{value:,}"
+
+
+def _fmt_float(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+# Despacho por tipo exacto para las celdas de tablas (un lookup por celda en el caso común)
+_CELL_FORMATTERS: dict[type, Callable[[Any], str]] = {
+    type(None): lambda _: "NULL",
+    str: str,
+    int: _fmt_int,
+    float: _fmt_float,
+}
+
 
 class CommandCompleter(Completer):
     def __init__(self, commands: list[tuple[str, str]]):
@@ -127,7 +151,7 @@ class ChatStreamingDisplay:
         # SQL Panel: Hide in simple mode or if explicitly disabled
         if not simple_mode and show_sql:
             sql_panel = Panel(
-                Syntax(self.sql, "sql", theme="monokai", line_numbers=False) if self.sql else Text("Esperando SQL...", style="dim"),
+                Syntax(self.sql, _SQL_LEXER, theme=_SQL_THEME, line_numbers=False) if self.sql else Text("Esperando SQL...", style="dim"),
                 title="SQL",
                 border_style="cyan",
             )
@@ -158,12 +182,14 @@ class ChatApp:
         limit: int | None = None,
         timeout: int | None = None,
         plain: bool = False,
+        page_size: int | None = None,
     ):
         self.console = Console(color_system=None if plain else "auto")
         self.mode = mode
         self.output_format = output_format
         self.limit = limit or int(os.getenv("MAX_QUERY_ROWS", "1000"))
         self.timeout = timeout or int(os.getenv("QUERY_TIMEOUT", "30"))
+        self.page_size = max(1, page_size or int(os.getenv("CHAT_PAGE_SIZE", "200")))
         
         # Load configuration
         self.config = load_config()
@@ -310,11 +336,49 @@ class ChatApp:
             enriched_prompt = f"{prompt.strip()} (limita resultados a {self.limit} filas usando LIMIT)"
 
         self.last_prompt = prompt
+        # Un hit del semantic cache se responde sin lock ni ejecución (sin round-trips a Redis)
+        result = semantic_cache_hit(enriched_prompt)
+        if result is None:
+            result = self._execute_prompt(prompt, enriched_prompt)
+            if result is None:
+                return
+
+        if isinstance(result, dict):
+            response = result.get("response")
+            sql_generated = result.get("sql_generated")
+            self.last_sql = sql_generated
+            self.last_result = response
+            
+            # Print metadata only if not in simple mode or explicitly enabled
+            if not self.config.get("simple_mode", False):
+                 self._print_metadata(sql_generated, result)
+                 
+            self._render_response(response)
+            save_query(
+                prompt,
+                sql_generated,
+                str(response) if response else None,
+                success=result.get("success", True),
+                cache_hit_type=result.get("cache_hit_type"),
+                model_used=result.get("model_used"),
+            )
+            self._record_stats(result)
+        else:
+            self.last_result = result
+            self.last_sql = None
+            self._render_response(result)
+            save_query(prompt, None, str(result), success=True)
+
+        if not is_retry:
+            self.console.print("[dim]Use /retry to resend or /export to save last result[/dim]")
+
+    def _execute_prompt(self, prompt: str, enriched_prompt: str) -> str | dict[str, Any] | None:
+        """Ejecuta el prompt bajo el lock por prompt; retorna None si no se ejecutó o falló."""
         lock_key = f"lock:prompt:{hashlib.md5(prompt.encode('utf-8')).hexdigest()}"
         got_lock = acquire_lock(lock_key, ttl_seconds=30)
         if not got_lock:
             self.console.print("[yellow]Otra ejecución similar está en curso; intenta de nuevo en unos segundos.[/yellow]")
-            return
+            return None
         try:
             # Decide whether to request analysis based on config
             prefer_analysis = self.config.get("show_thinking", True)
@@ -334,6 +398,7 @@ class ChatApp:
                         stream=True,
                         stream_callback=stream_callback,
                         prefer_analysis=prefer_analysis,
+                        check_semantic_cache=False,
                     )
                 finally:
                     display.stop()
@@ -345,13 +410,14 @@ class ChatApp:
                         return_metadata=True,
                         stream=False,
                         prefer_analysis=prefer_analysis,
+                        check_semantic_cache=False,
                     )
         except SQLValidationError as e:
             self.console.print(f"[red]Validation error:[/red] {e.message}")
-            return
+            return None
         except DatabaseConnectionError as e:
             self.console.print(f"[red]DB error:[/red] {e.message}")
-            return
+            return None
         except Exception as e:
             logger.exception("Unexpected error in chat prompt")
             msg = str(e)
@@ -360,38 +426,10 @@ class ChatApp:
                 self.console.print("[dim]Sugerencia: usa LIMIT más pequeño, añade filtros de fecha o sube QUERY_TIMEOUT.[/dim]")
             else:
                 self.console.print(f"[red]Error:[/red] {msg}")
-            return
+            return None
         finally:
             release_lock(lock_key)
-
-        if isinstance(result, dict):
-            response = result.get("response")
-            sql_generated = result.get("sql_generated")
-            self.last_sql = sql_generated
-            self.last_result = response
-            
-            # Print metadata only if not in simple mode or explicitly enabled
-            if not self.config.get("simple_mode", False):
-                 self._print_metadata(sql_generated, result)
-                 
-            self._render_response(response)
-            save_query(
-                prompt,
-                sql_generated,
-                str(response) if response else None,
-                success=result.get("success", True),
-                cache_hit_type=result.get("cache_hit_type"),
-                model_used=result.get("model_used"),
-            )
-            self._record_stats(result)
-        else:
-            self.last_result = result
-            self.last_sql = None
-            self._render_response(result)
-            save_query(prompt, None, str(result), success=True)
-
-        if not is_retry:
-            self.console.print("[dim]Use /retry to resend or /export to save last result[/dim]")
+        return result
 
     # Manual SQL
     def _handle_manual_sql(self) -> None:
@@ -412,14 +450,14 @@ class ChatApp:
             return
         try:
             self.validator.validate_query(sql)
+            self._print_metadata(sql, {"sql_generated": sql, "success": True})
             with self.engine.connect() as conn:
-                result = conn.execute(sa_text(sql))
-                rows = result.fetchall()
+                # stream_results: cursor del lado del servidor, las filas llegan por páginas
+                result = conn.execution_options(stream_results=True).execute(sa_text(sql))
                 columns = list(result.keys())
+                rows = self._render_result_pages(result, columns)
             self.last_sql = sql
             self.last_result = rows
-            self._print_metadata(sql, {"sql_generated": sql, "success": True})
-            self._render_table(rows, columns)
             save_query(sql, sql, f"{len(rows)} rows", success=True)
         except SQLValidationError as e:
             self.console.print(f"[red]Validation error:[/red] {e.message}")
@@ -447,11 +485,56 @@ class ChatApp:
         table = Table(show_header=True, header_style="bold magenta")
         for col in cols:
             table.add_column(str(col))
+        # Formateador y add_row resueltos una vez para todo el resultado
+        fmt = self._fmt_value
+        add_row = table.add_row
         for row in rows:
-            formatted = [self._fmt_value(v) for v in row]
-            table.add_row(*formatted)
+            add_row(*map(fmt, row))
         self.console.print(table)
 
+    def _render_result_pages(self, result: Any, columns: list[str]) -> list[Any]:
+        """
+        Muestra un resultado SQL a medida que se leen páginas de self.page_size filas.
+
+        Si cabe en una página se muestra como una tabla normal; si no, cada página se
+        imprime al llegar (encabezado solo en la primera, mismos anchos de columna).
+        Retorna todas las filas (para /export).
+        """
+        page_size = self.page_size
+        first_page = result.fetchmany(page_size)
+        page = result.fetchmany(page_size) if len(first_page) == page_size else []
+        if not page:
+            self._render_table(first_page, columns)
+            return list(first_page)
+
+        rows = list(first_page)
+        widths = self._render_table_page(first_page, columns, None)
+        while page:
+            rows.extend(page)
+            self._render_table_page(page, columns, widths)
+            page = result.fetchmany(page_size)
+        return rows
+
+    def _render_table_page(
+        self, rows: Sequence[Sequence[Any]], columns: list[str], widths: list[int] | None
+    ) -> list[int]:
+        """Imprime una página de filas; sin `widths` (primera página) los calcula y muestra el encabezado."""
+        fmt = self._fmt_value
+        formatted = [list(map(fmt, row)) for row in rows]
+        show_header = widths is None
+        if widths is None:
+            widths = [
+                max(cell_len(str(col)), *(cell_len(row[i]) for row in formatted if i < len(row)))
+                for i, col in enumerate(columns)
+            ]
+        table = Table(show_header=show_header, header_style="bold magenta")
+        for col, width in zip(columns, widths):
+            table.add_column(str(col), width=width, overflow="fold")
+        for row in formatted:
+            table.add_row(*row)
+        self.console.print(table)
+        return widths
+
     def _print_metadata(self, sql: str | None, meta: dict[str, Any]) -> None:
         parts = []
         if sql:
@@ -677,37 +760,39 @@ class ChatApp:
         if isinstance(data, list):
             if not data:
                 return [], []
-            first = data[0]
-            if isinstance(first, dict):
-                columns = list(first.keys())
-                rows = [[row.get(col) for col in columns] for row in data]  # type: ignore
-                return rows, columns
-            if isinstance(first, (list, tuple)):
-                columns = [f"col_{i+1}" for i in range(len(first))]
-                return [list(row) for row in data], columns  # type: ignore
-        try:
-            parsed = ast.literal_eval(str(response))
-            if isinstance(parsed, list) and parsed:
-                first = parsed[0]
-                if isinstance(first, dict):
-                    columns = list(first.keys())
-                    rows = [[row.get(col) for col in columns] for row in parsed]  # type: ignore
-                    return rows, columns
-                if isinstance(first, (list, tuple)):
-                    columns = [f"col_{i+1}" for i in range(len(first))]
-                    return [list(row) for row in parsed], columns
-        except Exception:
-            return None
+        else:
+            # Solo un texto con forma de lista puede contener filas: el texto plano se
+            # descarta sin str() ni literal_eval (que tokeniza la respuesta completa)
+            text = data if isinstance(data, str) else str(data)
+            if text.lstrip()[:1] not in ("[", "("):
+                return None
+            try:
+                data = ast.literal_eval(text)
+            except Exception:
+                return None
+            if not isinstance(data, list) or not data:
+                return None
+
+        first = data[0]
+        if isinstance(first, dict):
+            columns = list(first.keys())
+            rows = [[row.get(col) for col in columns] for row in data]  # type: ignore
+            return rows, columns
+        if isinstance(first, (list, tuple)):
+            columns = [f"col_{i+1}" for i in range(len(first))]
+            return [list(row) for row in data], columns  # type: ignore
         return None
 
     @staticmethod
     def _fmt_value(value: Any) -> str:
-        if value is None:
-            return "NULL"
+        formatter = _CELL_FORMATTERS.get(type(value))
+        if formatter is not None:
+            return formatter(value)
+        # Subclases (bool, IntEnum, ...)
         if isinstance(value, float):
-            return f"{value:,.2f}"
+            return _fmt_float(value)
         if isinstance(value, int):
-            return f"{value:,}"
+            return _fmt_int(value)
         return str(value)
 
 
@@ -718,6 +803,7 @@ def main() -> None:
     parser.add_argument("--limit", type=int, default=None, help="Row limit hint for the agent")
     parser.add_argument("--timeout", type=int, default=None, help="Query timeout seconds")
     parser.add_argument("--plain", action="store_true", help="Disable colors")
+    parser.add_argument("--page-size", type=int, default=None, help="Rows per page when streaming manual SQL results")
     args = parser.parse_args()
 
     try:
@@ -727,6 +813,7 @@ def main() -> None:
             limit=args.limit,
             timeout=args.timeout,
             plain=args.plain,
+            page_size=args.page_size,
         )
         app.run()
     except DatabaseConnectionError as e:
@@ -1,6 +1,7 @@
 """Definición del schema estático de la base de datos usando Pydantic."""
 
 import os
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
@@ -120,6 +121,17 @@ class CachedSchema:
 # Cache global del schema con TTL
 _schema_cache: Optional[CachedSchema] = None
 
+# Versión monotónica del schema cacheado (se incrementa en cada carga)
+_schema_version: int = 0
+
+# Refresh en background (stale-while-revalidate): un solo refresh a la vez
+_refresh_lock = threading.Lock()
+_refresh_in_progress = False
+
+# Último texto de prompt por formato ("full" | "compact") con el schema que lo generó.
+# Se compara por identidad: load_schema retorna el mismo objeto hasta que el cache expira.
+_prompt_text_cache: dict[str, tuple[DatabaseSchema, str]] = {}
+
 
 def _load_static_schema() -> DatabaseSchema:
     """
@@ -159,7 +171,11 @@ def _load_static_schema() -> DatabaseSchema:
     )
 
 
-def load_schema(use_discovery: bool | None = None, force_refresh: bool = False) -> DatabaseSchema:
+def load_schema(
+    use_discovery: bool | None = None,
+    force_refresh: bool = False,
+    stale_while_revalidate: bool = False,
+) -> DatabaseSchema:
     """
     Carga el schema de la base de datos con cache TTL.
     
@@ -173,21 +189,32 @@ def load_schema(use_discovery: bool | None = None, force_refresh: bool = False)
         use_discovery: Si True, fuerza discovery. Si False, fuerza estático.
                       Si None, usa variable de entorno SCHEMA_DISCOVERY o intenta discovery.
         force_refresh: Si True, fuerza recarga del schema ignorando cache
+        stale_while_revalidate: Si True y el cache expiró, retorna el schema cacheado
+                      y lo recarga en background (ningún request espera I/O).
     
     Returns:
         DatabaseSchema con todas las tablas y columnas definidas
     """
-    global _schema_cache
+    # Usar cache si existe, no expiró y no se fuerza refresh
+    if _schema_cache and not force_refresh:
+        if not _schema_cache.is_expired():
+            from src.utils.logger import logger
+            logger.debug(f"Usando schema cacheado (expira en {(_schema_cache.fetched_at + timedelta(seconds=_schema_cache.ttl_seconds) - datetime.now()).seconds}s)")
+            return _schema_cache.schema
+        if stale_while_revalidate:
+            refresh_schema_async(use_discovery)
+            return _schema_cache.schema
+    
+    return _reload_schema(use_discovery)
+
+
+def _reload_schema(use_discovery: bool | None = None) -> DatabaseSchema:
+    """Carga el schema (sin consultar el cache) y lo guarda en el cache con TTL."""
+    global _schema_cache, _schema_version
     
     # Obtener TTL de variable de entorno
     ttl = int(os.getenv("SCHEMA_TTL_SECONDS", "300"))
     
-    # Usar cache si existe, no expiró y no se fuerza refresh
-    if _schema_cache and not _schema_cache.is_expired() and not force_refresh:
-        from src.utils.logger import logger
-        logger.debug(f"Usando schema cacheado (expira en {(_schema_cache.fetched_at + timedelta(seconds=_schema_cache.ttl_seconds) - datetime.now()).seconds}s)")
-        return _schema_cache.schema
-    
     # Cargar schema (discovery o estático)
     schema = _load_schema_internal(use_discovery)
     
@@ -197,6 +224,7 @@ def load_schema(use_discovery: bool | None = None, force_refresh: bool = False)
         fetched_at=datetime.now(),
         ttl_seconds=ttl
     )
+    _schema_version += 1
     
     from src.utils.logger import logger
     logger.info(f"Schema cargado y cacheado (TTL: {ttl}s, tablas: {len(schema.tables)})")
@@ -204,6 +232,48 @@ def load_schema(use_discovery: bool | None = None, force_refresh: bool = False)
     return schema
 
 
+def refresh_schema_async(use_discovery: bool | None = None) -> bool:
+    """
+    Recarga el schema en un hilo de background si no hay otro refresh en curso.
+    
+    Args:
+        use_discovery: Igual que en load_schema
+    
+    Returns:
+        True si se lanzó un refresh, False si ya había uno en curso
+    """
+    global _refresh_in_progress
+    
+    with _refresh_lock:
+        if _refresh_in_progress:
+            return False
+        _refresh_in_progress = True
+    
+    def _worker() -> None:
+        global _refresh_in_progress
+        try:
+            _reload_schema(use_discovery)
+        except Exception as e:
+            from src.utils.logger import logger
+            logger.warning(f"Error al refrescar schema en background: {e}")
+        finally:
+            with _refresh_lock:
+                _refresh_in_progress = False
+    
+    threading.Thread(target=_worker, name="schema-refresh", daemon=True).start()
+    return True
+
+
+def get_schema_version() -> int:
+    """
+    Retorna la versión actual del schema cacheado.
+    
+    La versión se incrementa cada vez que el schema se (re)carga, por lo que sirve
+    como clave para caches derivados del schema.
+    """
+    return _schema_version
+
+
 def _load_schema_internal(use_discovery: bool | None = None) -> DatabaseSchema:
     """
     Carga el schema internamente (sin cache).
@@ -280,6 +350,10 @@ def get_schema_for_prompt(schema: DatabaseSchema) -> str:
     Returns:
         String formateado con la descripción del schema
     """
+    cached = _prompt_text_cache.get("full")
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
     lines = ["=== SCHEMA DE BASE DE DATOS ===\n"]
 
     for table_name, table in schema.tables.items():
@@ -302,7 +376,9 @@ def get_schema_for_prompt(schema: DatabaseSchema) -> str:
 
         lines.append("")
 
-    return "\n".join(lines)
+    text = "\n".join(lines)
+    _prompt_text_cache["full"] = (schema, text)
+    return text
 
 
 def get_schema_for_prompt_compact(schema: DatabaseSchema) -> str:
@@ -318,6 +394,10 @@ def get_schema_for_prompt_compact(schema: DatabaseSchema) -> str:
     Returns:
         String formateado con schema compacto
     """
+    cached = _prompt_text_cache.get("compact")
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
     lines = ["=== SCHEMA (COMPACTO) ===\n"]
     
     for table_name, table in schema.tables.items():
@@ -359,4 +439,6 @@ def get_schema_for_prompt_compact(schema: DatabaseSchema) -> str:
         table_line = f"{table_name}({', '.join(col_parts)})"
         lines.append(table_line)
     
-    return "\n".join(lines)
+    text = "\n".join(lines)
+    _prompt_text_cache["compact"] = (schema, text)
+    return text
@@ -2,28 +2,119 @@
 
 import json
 import os
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 from src.utils.logger import logger
 
-# Ruta del archivo de historial
+# Ruta del archivo de historial (JSONL: una entrada por línea, la más reciente al final)
 HISTORY_FILE = Path.home() / ".llm_dw_history.json"
 MAX_HISTORY_ENTRIES = 100
 DISABLE_HISTORY = os.getenv("DISABLE_HISTORY", "false").lower() in ("true", "1", "yes")
 
+# Tamaño de bloque para leer el final del archivo hacia atrás
+_TAIL_CHUNK_SIZE = 64 * 1024
 
-def save_query(
+# Líneas escritas por archivo desde la última compactación (evita recontar en cada save).
+# Es un conteo por proceso: antes de compactar se recuenta bajo _history_lock.
+_line_counts: Dict[Path, int] = {}
+
+
+@contextmanager
+def _history_lock(path: Path) -> Iterator[None]:
+    """
+    Lock exclusivo entre procesos (p. ej. varios workers de uvicorn) sobre `<historial>.lock`.
+
+    Sin fcntl (Windows) no bloquea: ahí la compactación asume un único proceso escritor.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path.with_name(path.name + ".lock"), "ab") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _is_legacy_format(path: Path) -> bool:
+    """Detecta el formato anterior (un único array JSON) leyendo solo el primer byte útil."""
+    with open(path, "rb") as f:
+        head = f.read(64).lstrip()
+    return head.startswith(b"[")
+
+
+def _migrate_legacy_file(path: Path) -> None:
+    """Reescribe un historial en array JSON (más reciente primero) como JSONL."""
+    try:
+        legacy = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        legacy = []
+    if not isinstance(legacy, list):
+        legacy = []
+
+    entries = legacy[:MAX_HISTORY_ENTRIES]
+    _write_lines(path, [orjson.dumps(entry) for entry in reversed(entries)])
+    _line_counts[path] = len(entries)
+
+
+def _write_lines(path: Path, lines: List[bytes]) -> None:
+    """Reemplaza el archivo de forma atómica con las líneas dadas."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for line in lines:
+            f.write(line + b"\n")
+    os.replace(tmp_path, path)
+
+
+def _read_tail_lines(path: Path, max_lines: int) -> List[bytes]:
+    """Lee las últimas `max_lines` líneas no vacías retrocediendo en bloques de 64KB."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buffer = b""
+        while pos > 0 and buffer.count(b"\n") <= max_lines:
+            read_size = min(_TAIL_CHUNK_SIZE, pos)
+            pos -= read_size
+            f.seek(pos)
+            buffer = f.read(read_size) + buffer
+
+    lines = buffer.splitlines()
+    if pos > 0 and lines:
+        # La primera línea del buffer puede estar cortada.
+        lines = lines[1:]
+    lines = [line for line in lines if line.strip()]
+    return lines[-max_lines:] if max_lines > 0 else []
+
+
+def _count_lines(path: Path) -> int:
+    """Cuenta las líneas de un historial JSONL (0 si no existe)."""
+    if not path.exists():
+        return 0
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def build_history_entry(
     question: str,
     sql: str | None = None,
     response: str | None = None,
     success: bool = True,
     cache_hit_type: str | None = None,
     model_used: str | None = None,
-) -> None:
+) -> Dict[str, Any]:
     """
-    Guarda una query en el historial.
+    Construye una entrada de historial (con timestamp actual).
 
     Args:
         question: Pregunta en lenguaje natural
@@ -32,69 +123,131 @@ def save_query(
         success: Si la query fue exitosa
         cache_hit_type: Tipo de cache hit (opcional)
         model_used: Modelo usado (opcional)
+
+    Returns:
+        Entrada lista para save_history_entries
+    """
+    entry = {
+        "timestamp": datetime.now().isoformat(),
+        "question": question,
+        "sql": sql,
+        "success": success,
+        "response_preview": response[:200] + "..." if response and len(response) > 200 else response,
+    }
+
+    if cache_hit_type is not None:
+        entry["cache_hit_type"] = cache_hit_type
+    if model_used is not None:
+        entry["model_used"] = model_used
+    return entry
+
+
+def save_history_entries(entries: List[Dict[str, Any]]) -> None:
+    """
+    Agrega varias entradas al historial con una sola escritura.
+
+    Las entradas se agregan al final del archivo (O(1)); cuando el archivo supera
+    2 * MAX_HISTORY_ENTRIES líneas se compacta a las últimas MAX_HISTORY_ENTRIES.
+    Escritura y compactación van bajo un lock de archivo, así otro proceso no
+    pierde las líneas que agregó mientras este reescribe el archivo.
+
+    Args:
+        entries: Entradas (de build_history_entry), de la más antigua a la más reciente
     """
     if DISABLE_HISTORY:
         logger.debug("Historial deshabilitado por DISABLE_HISTORY=true")
         return
+    if not entries:
+        return
     try:
-        # Cargar historial existente
-        history = load_history()
-        
-        # Crear nueva entrada
-        entry = {
-            "timestamp": datetime.now().isoformat(),
-            "question": question,
-            "sql": sql,
-            "success": success,
-            "response_preview": response[:200] + "..." if response and len(response) > 200 else response,
-        }
-
-        if cache_hit_type is not None:
-            entry["cache_hit_type"] = cache_hit_type
-        if model_used is not None:
-            entry["model_used"] = model_used
-        
-        # Agregar al inicio
-        history.insert(0, entry)
-        
-        # Limitar tamaño
-        if len(history) > MAX_HISTORY_ENTRIES:
-            history = history[:MAX_HISTORY_ENTRIES]
-        
-        # Guardar
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-        
-        logger.debug(f"Query guardada en historial: {question[:50]}...")
-    
+        path = HISTORY_FILE
+        with _history_lock(path):
+            if path.exists() and _is_legacy_format(path):
+                _migrate_legacy_file(path)
+
+            line_count = _line_counts.get(path)
+            if line_count is None:
+                line_count = _count_lines(path)
+
+            # Agregar al final
+            with open(path, "ab") as f:
+                f.write(b"".join(orjson.dumps(entry) + b"\n" for entry in entries))
+            line_count += len(entries)
+
+            # Limitar tamaño; el conteo local puede estar desactualizado si otro proceso
+            # escribió o compactó, así que se recuenta antes de reescribir.
+            if line_count > 2 * MAX_HISTORY_ENTRIES:
+                line_count = _count_lines(path)
+                if line_count > 2 * MAX_HISTORY_ENTRIES:
+                    kept = _read_tail_lines(path, MAX_HISTORY_ENTRIES)
+                    _write_lines(path, kept)
+                    line_count = len(kept)
+            _line_counts[path] = line_count
+
+        logger.debug(f"{len(entries)} queries guardadas en historial")
+
     except Exception as e:
         logger.warning(f"Error al guardar en historial: {e}")
 
 
+def save_query(
+    question: str,
+    sql: str | None = None,
+    response: str | None = None,
+    success: bool = True,
+    cache_hit_type: str | None = None,
+    model_used: str | None = None,
+) -> None:
+    """
+    Guarda una query en el historial.
+
+    Args:
+        question: Pregunta en lenguaje natural
+        sql: SQL generado (opcional)
+        response: Respuesta del agente (opcional)
+        success: Si la query fue exitosa
+        cache_hit_type: Tipo de cache hit (opcional)
+        model_used: Modelo usado (opcional)
+    """
+    if DISABLE_HISTORY:
+        logger.debug("Historial deshabilitado por DISABLE_HISTORY=true")
+        return
+    entry = build_history_entry(question, sql, response, success, cache_hit_type, model_used)
+    save_history_entries([entry])
+
+
 def load_history(limit: int | None = None) -> List[Dict[str, Any]]:
     """
     Carga el historial de queries.
 
+    Solo lee el final del archivo necesario para `limit` entradas.
+
     Args:
         limit: Número máximo de entradas a retornar (None = todas)
 
     Returns:
-        Lista de entradas del historial
+        Lista de entradas del historial (más reciente primero)
     """
     try:
         if DISABLE_HISTORY:
             return []
         if not HISTORY_FILE.exists():
             return []
-        
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            history = json.load(f)
-        
-        if limit:
-            return history[:limit]
-        
+
+        max_entries = min(limit, MAX_HISTORY_ENTRIES) if limit else MAX_HISTORY_ENTRIES
+
+        if _is_legacy_format(HISTORY_FILE):
+            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)[:max_entries]
+
+        history: List[Dict[str, Any]] = []
+        for line in reversed(_read_tail_lines(HISTORY_FILE, max_entries)):
+            try:
+                history.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                logger.debug("Línea inválida en historial, se omite")
         return history
-    
+
     except Exception as e:
         logger.warning(f"Error al cargar historial: {e}")
         return []
@@ -103,6 +256,7 @@ def load_history(limit: int | None = None) -> List[Dict[str, Any]]:
 def clear_history() -> None:
     """Limpia el historial completo."""
     try:
+        _line_counts.pop(HISTORY_FILE, None)
         if HISTORY_FILE.exists():
             HISTORY_FILE.unlink()
         logger.info("Historial limpiado")
@@ -120,7 +274,9 @@ def get_history_entry(index: int) -> Dict[str, Any] | None:
     Returns:
         Entrada del historial o None si no existe
     """
-    history = load_history()
-    if 0 <= index < len(history):
+    if index < 0:
+        return None
+    history = load_history(limit=index + 1)
+    if index < len(history):
         return history[index]
     return None
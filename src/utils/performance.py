@@ -1,5 +1,6 @@
 """Monitoreo de performance de queries SQL."""
 
+import heapq
 import json
 import os
 from datetime import datetime, timedelta
@@ -183,27 +184,23 @@ def get_slow_queries(threshold_seconds: float = 5.0, limit: int = 10) -> List[Di
     """
     all_metrics = load_performance_metrics()
     
-    slow_queries = [
-        m for m in all_metrics
-        if m.get("execution_time", 0) >= threshold_seconds 
-        and m.get("success", False)
-        and m.get("sql", "").strip()  # Solo queries con SQL válido
-    ]
-    
-    # Eliminar duplicados basados en SQL hash y timestamp
-    seen = set()
-    unique_queries = []
-    for query in slow_queries:
-        # Usar hash SQL + timestamp como key único
-        key = (query.get("sql_hash", ""), query.get("timestamp", ""))
-        if key not in seen and key[0]:  # Solo si tiene hash válido
-            seen.add(key)
-            unique_queries.append(query)
-    
-    # Ordenar por tiempo de ejecución (descendente)
-    unique_queries.sort(key=lambda x: x.get("execution_time", 0), reverse=True)
+    def unique_slow_queries():
+        # Filtrar y eliminar duplicados (SQL hash + timestamp) sin listas intermedias
+        seen = set()
+        for m in all_metrics:
+            if not (
+                m.get("execution_time", 0) >= threshold_seconds
+                and m.get("success", False)
+                and m.get("sql", "").strip()  # Solo queries con SQL válido
+            ):
+                continue
+            key = (m.get("sql_hash", ""), m.get("timestamp", ""))
+            if key not in seen and key[0]:  # Solo si tiene hash válido
+                seen.add(key)
+                yield m
     
-    return unique_queries[:limit]
+    # Top `limit` por tiempo de ejecución (descendente); nlargest evita ordenar todo
+    return heapq.nlargest(limit, unique_slow_queries(), key=lambda x: x.get("execution_time", 0))
 
 
 def get_failed_queries(limit: int = 10) -> List[Dict[str, Any]]:
@@ -218,15 +215,10 @@ def get_failed_queries(limit: int = 10) -> List[Dict[str, Any]]:
     """
     all_metrics = load_performance_metrics()
     
-    failed_queries = [
-        m for m in all_metrics
-        if not m.get("success", True)
-    ]
+    failed_queries = (m for m in all_metrics if not m.get("success", True))
     
-    # Ordenar por timestamp (descendente = más recientes primero)
-    failed_queries.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    
-    return failed_queries[:limit]
+    # Top `limit` por timestamp (descendente = más recientes primero)
+    return heapq.nlargest(limit, failed_queries, key=lambda x: x.get("timestamp", ""))
 
 
 def get_performance_stats(days: int = 7) -> Dict[str, Any]:
@@ -351,18 +343,16 @@ def get_query_patterns(limit: int = 10) -> List[Dict[str, Any]]:
             pattern["fail_count"] += 1
     
     # Calcular promedios y filtrar patrones sin SQL válido
-    valid_patterns = []
-    for pattern in patterns.values():
-        if pattern["count"] > 0:
-            pattern["avg_time"] = pattern["total_time"] / pattern["count"]
-            # Solo incluir patrones con SQL preview válido
-            if pattern.get("sql_preview", "").strip():
-                valid_patterns.append(pattern)
-    
-    # Ordenar por frecuencia (descendente)
-    sorted_patterns = sorted(valid_patterns, key=lambda x: x["count"], reverse=True)
+    def valid_patterns():
+        for pattern in patterns.values():
+            if pattern["count"] > 0:
+                pattern["avg_time"] = pattern["total_time"] / pattern["count"]
+                # Solo incluir patrones con SQL preview válido
+                if pattern.get("sql_preview", "").strip():
+                    yield pattern
     
-    return sorted_patterns[:limit]
+    # Top `limit` por frecuencia (descendente)
+    return heapq.nlargest(limit, valid_patterns(), key=lambda x: x["count"])
 
 
 def clear_performance_metrics() -> None:
@@ -0,0 +1,51 @@
+"""Helpers para parsear timestamps ISO del historial y métricas."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+try:
+    # Opcional: parser ISO 8601 en C, más rápido que fromisoformat en Python < 3.11.
+    from ciso8601 import parse_datetime as _parse_iso
+except ImportError:
+    _parse_iso = datetime.fromisoformat
+
+
+@lru_cache(maxsize=4096)
+def timestamp_to_epoch(ts_raw: str) -> float | None:
+    """
+    Convierte un timestamp ISO a epoch (segundos), cacheando el resultado.
+
+    Los timestamps del historial/métricas no cambian una vez escritos, así que
+    requests repetidos solo comparan floats en lugar de re-parsear cada entrada.
+
+    Args:
+        ts_raw: Timestamp en formato ISO 8601
+
+    Returns:
+        Epoch en segundos o None si el timestamp es inválido
+    """
+    try:
+        return _parse_iso(ts_raw).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def cutoff_epoch(days: int) -> float:
+    """Epoch correspondiente a `ahora - days`."""
+    return (datetime.now() - timedelta(days=days)).timestamp()
+
+
+def filter_by_days(entries: list[dict], days: int) -> list[dict]:
+    """Filtra entradas cuyo `timestamp` cae dentro de los últimos `days` días."""
+    cutoff = cutoff_epoch(days)
+    filtered: list[dict] = []
+    for entry in entries:
+        ts_raw = entry.get("timestamp")
+        if not ts_raw:
+            continue
+        ts = timestamp_to_epoch(ts_raw)
+        if ts is not None and ts >= cutoff:
+            filtered.append(entry)
+    return filtered
@@ -1,5 +1,6 @@
 import re
-from typing import Dict, Set
+from functools import cached_property
+from typing import Dict, FrozenSet, Set
 
 import sqlglot
 from sqlglot import exp
@@ -114,6 +115,14 @@ class SQLValidator:
         """
         self.schema = schema
 
+    @cached_property
+    def _column_index(self) -> Dict[str, FrozenSet[str]]:
+        """Lowercased column names per schema table, built once per validator."""
+        return {
+            table_name: frozenset(col.name.lower() for col in table.columns)
+            for table_name, table in self.schema.tables.items()
+        }
+
     def validate_query(self, sql: str) -> None:
         """
         Validates a full SQL query (only SELECT/CTE/UNION) using sqlglot AST.
@@ -246,6 +255,7 @@ class SQLValidator:
         cte_names: Set[str],
         select_aliases: Set[str],
     ) -> None:
+        column_index = self._column_index
         for column in expression.find_all(exp.Column):
             column_name = column.name
             if not column_name or column_name == "*":
@@ -263,17 +273,13 @@ class SQLValidator:
                 if not self.schema.validate_table(real_table):
                     allowed_tables = self.schema.get_allowed_tables()
                     raise InvalidTableError(real_table, allowed_tables)
-                if not self.schema.validate_column(real_table, column_name):
+                if column_name.lower() not in column_index.get(real_table.lower(), ()):
                     allowed_columns = self.schema.get_allowed_columns(real_table)
                     raise InvalidColumnError(column_name, real_table, allowed_columns)
             else:
                 # No table: validate against all schema tables
-                found = False
-                for schema_table_name in self.schema.tables.keys():
-                    if self.schema.validate_column(schema_table_name, column_name):
-                        found = True
-                        break
-                if not found:
+                column_lower = column_name.lower()
+                if not any(column_lower in columns for columns in column_index.values()):
                     all_columns = []
                     for schema_table in self.schema.tables.values():
                         all_columns.extend([col.name for col in schema_table.columns])
@@ -7,9 +7,11 @@ from fastapi.testclient import TestClient
 
 
 @pytest.fixture
-def api_client() -> TestClient:
+def api_client(monkeypatch: pytest.MonkeyPatch) -> TestClient:
     from src.api.app import create_app
 
+    monkeypatch.setenv("WEB_API_WARMUP", "false")
+
     with TestClient(create_app()) as client:
         yield client
 
@@ -49,7 +51,7 @@ def test_schema_endpoint_compact(monkeypatch: pytest.MonkeyPatch, api_client: Te
 def test_validate_sql_endpoint(monkeypatch: pytest.MonkeyPatch, api_client: TestClient, sample_schema) -> None:
     import src.api.routers.validate_sql as validate_sql_router
 
-    monkeypatch.setattr(validate_sql_router, "load_schema", lambda force_refresh=False: sample_schema)
+    monkeypatch.setattr(validate_sql_router, "load_schema", lambda **_kwargs: sample_schema)
 
     ok = api_client.post("/api/v1/validate-sql", json={"sql": "SELECT id, revenue FROM sales"})
     assert ok.status_code == 200
@@ -139,3 +141,291 @@ def test_stats_endpoint(monkeypatch: pytest.MonkeyPatch, api_client: TestClient)
     assert data["recent_metrics_count"] == 2
     assert len(data["slow_queries"]) == 1
     assert len(data["failed_queries"]) == 1
+
+
+def test_parse_allowed_origins_filters_wildcard_and_caches() -> None:
+    from src.api.app import DEFAULT_ALLOWED_ORIGINS, _parse_allowed_origins
+
+    assert _parse_allowed_origins(None) == DEFAULT_ALLOWED_ORIGINS
+    assert _parse_allowed_origins("  ") == DEFAULT_ALLOWED_ORIGINS
+    assert _parse_allowed_origins("http://a.com, *, http://b.com") == ("http://a.com", "http://b.com")
+    assert _parse_allowed_origins("*") == DEFAULT_ALLOWED_ORIGINS
+
+    _parse_allowed_origins.cache_clear()
+    _parse_allowed_origins("http://a.com")
+    _parse_allowed_origins("http://a.com")
+    assert _parse_allowed_origins.cache_info().hits == 1
+
+
+def test_orjson_response_renders_non_str_keys() -> None:
+    from src.api.responses import ORJSONResponse
+
+    resp = ORJSONResponse(content={1: "a", "b": [1.5, None]})
+    assert resp.body == b'{"1":"a","b":[1.5,null]}'
+    assert resp.media_type == "application/json"
+
+
+def test_response_model_routes_keep_default_response_class() -> None:
+    from fastapi.datastructures import DefaultPlaceholder
+
+    from src.api.app import create_app
+    from src.api.routers import health, history, query, schema, stats
+
+    # A non-default response class disables FastAPI's pydantic dump_json fast path
+    assert isinstance(create_app().router.default_response_class, DefaultPlaceholder)
+    for module in (health, history, query, schema, stats):
+        for route in module.router.routes:
+            if route.response_model is not None:
+                assert isinstance(route.response_class, DefaultPlaceholder), route.path
+
+
+def test_sse_event_serializes_with_orjson() -> None:
+    from decimal import Decimal
+
+    from src.api.routers.query import _sse_event
+
+    event = _sse_event("analysis", {"content": "año", "value": Decimal("1.5")})
+    assert event.event == "analysis"
+    assert event.raw_data == '{"content":"año","value":"1.5"}'
+
+
+def test_query_stream_endpoint_emits_events(monkeypatch: pytest.MonkeyPatch, api_client: TestClient) -> None:
+    import src.api.routers.query as query_router
+    from src.api.models import QueryResponse
+
+    def fake_run_query_stream(*, question, limit, explain, stream_callback):
+        stream_callback({"type": "sql", "sql": "SELECT 1", "content": None})
+        return QueryResponse(success=True, response="[(1,)]", sql_generated="SELECT 1")
+
+    monkeypatch.setattr(query_router, "run_query_stream", fake_run_query_stream)
+
+    resp = api_client.get("/api/v1/query/stream", params={"question": "hola"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+    body = resp.text
+    assert body.startswith(": ok\n\n")
+    assert "event: sql\ndata: " in body
+    assert '"sql":"SELECT 1"' in body
+    assert "event: done\ndata: " in body
+
+
+def test_stats_endpoint_orders_and_limits_lists(monkeypatch: pytest.MonkeyPatch, api_client: TestClient) -> None:
+    import src.api.routers.stats as stats_router
+
+    now = datetime.now().isoformat()
+    fake_metrics = [
+        {"timestamp": now, "sql": "SELECT 1", "sql_hash": "a", "execution_time": 6.0, "success": True},
+        {"timestamp": now, "sql": "SELECT 2", "sql_hash": "b", "execution_time": 9.0, "success": True},
+        {"timestamp": now, "sql": "SELECT 2", "sql_hash": "b", "execution_time": 3.0, "success": True},
+        {"timestamp": now, "sql": "", "sql_hash": "c", "execution_time": 50.0, "success": True},
+    ]
+
+    monkeypatch.setattr(stats_router, "get_performance_stats", lambda days=7: {})
+    monkeypatch.setattr(stats_router, "load_performance_metrics", lambda limit=None: fake_metrics)
+
+    data = api_client.get("/api/v1/stats?slow_threshold_seconds=5&limit=1").json()
+    assert [m["execution_time"] for m in data["slow_queries"]] == [9.0]
+    assert data["failed_queries"] == []
+    assert len(data["patterns"]) == 1
+    assert data["patterns"][0]["sql_hash"] == "b"
+    assert data["patterns"][0]["count"] == 2
+    assert data["patterns"][0]["avg_time"] == 6.0
+
+
+def test_query_stream_endpoint_preserves_order_on_bursts(
+    monkeypatch: pytest.MonkeyPatch, api_client: TestClient
+) -> None:
+    import src.api.routers.query as query_router
+    from src.api.models import QueryResponse
+
+    def fake_run_query_stream(*, question, limit, explain, stream_callback):
+        for i in range(500):
+            stream_callback({"type": "analysis", "content": f"tok{i}"})
+        return QueryResponse(success=True, response="ok")
+
+    monkeypatch.setattr(query_router, "run_query_stream", fake_run_query_stream)
+
+    body = api_client.get("/api/v1/query/stream", params={"question": "hola"}).text
+    positions = [body.index(f'"tok{i}"') for i in range(500)]
+    assert positions == sorted(positions)
+    assert body.rstrip().splitlines()[-2] == "event: done"
+
+
+def test_query_stream_endpoint_bounds_pending_events(
+    monkeypatch: pytest.MonkeyPatch, api_client: TestClient
+) -> None:
+    import src.api.routers.query as query_router
+    from src.api.models import QueryResponse
+
+    # Tiny limits force the worker to wait for the drain instead of growing `pending`
+    monkeypatch.setattr(query_router, "_MAX_PENDING_EVENTS", 4)
+    monkeypatch.setattr(query_router, "_MAX_PENDING_BATCHES", 2)
+    batch_sizes = []
+    real_queue = query_router.asyncio.Queue
+
+    class RecordingQueue(real_queue):
+        def put_nowait(self, item):
+            batch_sizes.append(len(item))
+            super().put_nowait(item)
+
+    monkeypatch.setattr(query_router.asyncio, "Queue", RecordingQueue)
+
+    def fake_run_query_stream(*, question, limit, explain, stream_callback):
+        for i in range(300):
+            stream_callback({"type": "analysis", "content": f"tok{i}"})
+        return QueryResponse(success=True, response="ok")
+
+    monkeypatch.setattr(query_router, "run_query_stream", fake_run_query_stream)
+
+    body = api_client.get("/api/v1/query/stream", params={"question": "hola"}).text
+    positions = [body.index(f'"tok{i}"') for i in range(300)]
+    assert positions == sorted(positions)
+    assert body.rstrip().splitlines()[-2] == "event: done"
+    assert batch_sizes and max(batch_sizes) <= 4
+
+
+def test_startup_runs_warmup(monkeypatch: pytest.MonkeyPatch) -> None:
+    import src.api.app as app_module
+
+    called = {"count": 0}
+
+    def fake_warmup() -> None:
+        called["count"] += 1
+
+    monkeypatch.setenv("WEB_API_WARMUP", "true")
+    monkeypatch.setattr(app_module, "warmup", fake_warmup)
+
+    with TestClient(app_module.create_app()):
+        pass
+
+    assert called["count"] == 1
+
+
+def test_shutdown_flushes_queued_history(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    import json
+    import time
+
+    import src.api.app as app_module
+    import src.api.services.query_service as query_service
+    from src.utils import history
+
+    history_file = tmp_path / "history.jsonl"
+    monkeypatch.setattr(history, "HISTORY_FILE", history_file)
+    monkeypatch.setattr(history, "DISABLE_HISTORY", False)
+    monkeypatch.setenv("WEB_API_WARMUP", "false")
+
+    def slow_save_history_entries(entries):
+        time.sleep(0.05)
+        history.save_history_entries(entries)
+
+    monkeypatch.setattr(query_service, "save_history_entries", slow_save_history_entries)
+
+    with TestClient(app_module.create_app()):
+        for i in range(130):
+            query_service._save_query_in_background(question=f"q{i}", sql=None)
+
+    # The lifespan shutdown waited for the writer thread
+    lines = history_file.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["question"] for line in lines] == [f"q{i}" for i in range(130)]
+
+
+def test_warmup_tolerates_missing_database(monkeypatch: pytest.MonkeyPatch, sample_schema) -> None:
+    import src.api.services.query_service as query_service
+    from src.utils.exceptions import DatabaseConnectionError
+
+    def fail_engine():
+        raise DatabaseConnectionError("DATABASE_URL no está configurada")
+
+    agent_calls = []
+    monkeypatch.setattr(query_service, "_semantic_cache_ready", True)
+    monkeypatch.setattr(query_service, "load_schema", lambda **_kwargs: sample_schema)
+    monkeypatch.setattr(query_service, "get_db_engine", fail_engine)
+    monkeypatch.setattr(query_service, "create_sql_agent", lambda *a, **k: agent_calls.append(a))
+
+    query_service.warmup()
+    assert agent_calls == []
+
+
+def test_schema_response_bytes_cached_per_version(sample_schema) -> None:
+    from src.api.services.schema_service import get_schema_response_bytes
+
+    first = get_schema_response_bytes(sample_schema, 1, True, None)
+    assert get_schema_response_bytes(sample_schema, 1, True, None) is first
+    assert get_schema_response_bytes(sample_schema, 1, False, None) is not first
+
+    rebuilt = get_schema_response_bytes(sample_schema, 2, True, None)
+    assert rebuilt == first
+    assert rebuilt is not first
+
+
+def test_history_endpoint_offset_past_end(monkeypatch: pytest.MonkeyPatch, api_client: TestClient) -> None:
+    import src.api.routers.history as history_router
+
+    fake_history = [{"timestamp": "2025-01-01T00:00:00", "question": "Q1", "sql": None, "success": True}]
+    monkeypatch.setattr(history_router, "load_history", lambda limit=None: fake_history)
+
+    resp = api_client.get("/api/v1/history?limit=5&offset=3")
+    assert resp.status_code == 200
+    assert resp.json() == {"total": 1, "items": []}
+
+
+def test_stats_endpoint_tolerates_missing_fields(monkeypatch: pytest.MonkeyPatch, api_client: TestClient) -> None:
+    import src.api.routers.stats as stats_router
+
+    now = datetime.now().isoformat()
+    fake_metrics = [
+        {"timestamp": now, "sql": "SELECT 1", "sql_hash": "a", "execution_time": None, "success": True},
+        {"timestamp": now, "sql": None, "sql_hash": "b", "execution_time": 9.0, "success": False},
+        {"timestamp": now, "sql": "SELECT 3", "execution_time": 7.0},
+    ]
+    monkeypatch.setattr(stats_router, "get_performance_stats", lambda days=7: {})
+    monkeypatch.setattr(stats_router, "load_performance_metrics", lambda limit=None: fake_metrics)
+
+    resp = api_client.get("/api/v1/stats?slow_threshold_seconds=5")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["slow_queries"] == []
+    assert [m["sql_hash"] for m in data["failed_queries"]] == ["b"]
+    assert [p["sql_hash"] for p in data["patterns"]] == ["a", "unknown"]
+    assert data["patterns"][1]["fail_count"] == 1
+
+
+def test_startup_does_not_wait_for_warmup(monkeypatch: pytest.MonkeyPatch) -> None:
+    import threading
+
+    import src.api.app as app_module
+
+    release = threading.Event()
+    monkeypatch.setenv("WEB_API_WARMUP", "true")
+    monkeypatch.setattr(app_module, "warmup", lambda: release.wait(5))
+
+    with TestClient(app_module.create_app()) as client:
+        assert client.get("/api/v1/health").status_code == 200
+        release.set()
+
+
+def test_query_stream_done_event_serializes_model(monkeypatch: pytest.MonkeyPatch, api_client: TestClient) -> None:
+    from decimal import Decimal
+
+    import src.api.routers.query as query_router
+    from src.api.models import QueryResponse
+
+    def fake_run_query_stream(*, question, limit, explain, stream_callback):
+        return QueryResponse.model_construct(success=True, columns=["d"], rows=[{"d": Decimal("1.5")}])
+
+    monkeypatch.setattr(query_router, "run_query_stream", fake_run_query_stream)
+
+    body = api_client.get("/api/v1/query/stream", params={"question": "hola"}).text
+    done_line = body.split("event: done\ndata: ", 1)[1].splitlines()[0]
+    assert '"rows":[{"d":"1.5"}]' in done_line
+    assert '"success":true' in done_line
+
+
+def test_validate_sql_endpoint_reuses_validator_per_schema(sample_schema) -> None:
+    import src.api.routers.validate_sql as validate_sql_router
+
+    first = validate_sql_router._get_validator(sample_schema)
+    assert validate_sql_router._get_validator(sample_schema) is first
+    other = sample_schema.model_copy(deep=True)
+    assert validate_sql_router._get_validator(other) is not first
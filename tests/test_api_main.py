@@ -0,0 +1,40 @@
+"""Tests for src.api.__main__ entry point."""
+
+from __future__ import annotations
+
+
+def test_main_uses_fast_loop_and_workers(monkeypatch):
+    import src.api.__main__ as api_main
+
+    captured: dict = {}
+
+    def fake_run(app_path, **kwargs):
+        captured["app"] = app_path
+        captured.update(kwargs)
+
+    monkeypatch.setattr(api_main.uvicorn, "run", fake_run)
+    monkeypatch.setattr(api_main, "_resolve_loop_and_http", lambda: ("uvloop", "httptools"))
+    monkeypatch.setenv("WEB_API_RELOAD", "false")
+    monkeypatch.setenv("WEB_API_WORKERS", "3")
+
+    api_main.main()
+
+    assert captured["app"] == "src.api.app:app"
+    assert captured["loop"] == "uvloop"
+    assert captured["http"] == "httptools"
+    assert captured["workers"] == 3
+
+
+def test_resolve_workers_single_in_reload_mode(monkeypatch):
+    import src.api.__main__ as api_main
+
+    monkeypatch.setenv("WEB_API_WORKERS", "8")
+    assert api_main._resolve_workers(reload_enabled=True) == 1
+
+
+def test_resolve_workers_defaults_to_cpu_count(monkeypatch):
+    import src.api.__main__ as api_main
+
+    monkeypatch.delenv("WEB_API_WORKERS", raising=False)
+    monkeypatch.setattr(api_main.multiprocessing, "cpu_count", lambda: 1)
+    assert api_main._resolve_workers(reload_enabled=False) == 2
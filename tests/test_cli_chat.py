@@ -181,3 +181,101 @@ def test_handle_command_routes(monkeypatch: pytest.MonkeyPatch, sample_schema):
     output = app.console.export_text()
     assert "Unknown command" in output
 
+
+
+def test_handle_prompt_semantic_hit_skips_lock_and_execution(monkeypatch: pytest.MonkeyPatch):
+    import src.cli_chat as cli_chat_module
+
+    app: ChatApp = ChatApp.__new__(ChatApp)
+    app.console = Console(record=True)
+    app.mode = "power"
+    app.limit = None
+    app.config = {"simple_mode": True}
+    app.session_stats = {"queries": 0, "cache_sql": 0, "cache_semantic": 0, "cache_none": 0,
+                         "tokens_total": 0, "tokens_input": 0, "tokens_output": 0}
+
+    hit = {"response": "42 ventas", "sql_generated": "SELECT 42", "execution_time": 0.0,
+           "success": True, "cache_hit_type": "semantic"}
+    monkeypatch.setattr(cli_chat_module, "semantic_cache_hit", lambda _q: hit)
+    lock = MagicMock()
+    execute = MagicMock()
+    save = MagicMock()
+    monkeypatch.setattr(cli_chat_module, "acquire_lock", lock)
+    monkeypatch.setattr(cli_chat_module, "execute_query", execute)
+    monkeypatch.setattr(cli_chat_module, "save_query", save)
+
+    app._handle_prompt("¿cuántas ventas?")
+    lock.assert_not_called()
+    execute.assert_not_called()
+    assert app.last_sql == "SELECT 42"
+    assert app.session_stats["cache_semantic"] == 1
+    assert save.call_args.kwargs["cache_hit_type"] == "semantic"
+
+
+def test_fmt_value_type_dispatch_matches_subclasses():
+    import enum
+
+    class Level(enum.IntEnum):
+        HIGH = 2500
+
+    assert ChatApp._fmt_value("x") == "x"
+    assert ChatApp._fmt_value(-1234567) == "-1,234,567"
+    assert ChatApp._fmt_value(True) == "1"
+    assert ChatApp._fmt_value(Level.HIGH) == "2,500"
+    assert ChatApp._fmt_value(float("nan")) == "nan"
+    assert ChatApp._fmt_value([1, 2]) == "[1, 2]"
+
+
+def test_parse_rows_skips_literal_eval_for_plain_text(monkeypatch: pytest.MonkeyPatch):
+    import src.cli_chat as cli_chat_module
+
+    app: ChatApp = ChatApp.__new__(ChatApp)
+    assert app._parse_rows("  [(1, 'a'), (2, 'b')]") == ([[1, "a"], [2, "b"]], ["col_1", "col_2"])
+    assert app._parse_rows("[]") is None
+
+    def fail(_text):
+        raise AssertionError("plain text should not be parsed")
+
+    monkeypatch.setattr(cli_chat_module.ast, "literal_eval", fail)
+    assert app._parse_rows("Hay 3 clientes registrados.") is None
+    assert app._parse_rows({"a": 1}) is None
+
+
+class _PagedResult:
+    def __init__(self, rows):
+        self._rows = list(rows)
+        self.fetch_sizes = []
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        page, self._rows = self._rows[:size], self._rows[size:]
+        return page
+
+
+def test_render_result_pages_streams_large_results():
+    app: ChatApp = ChatApp.__new__(ChatApp)
+    app.console = Console(record=True, width=120)
+    app.page_size = 2
+
+    result = _PagedResult([(i, f"item_{i}") for i in range(5)])
+    rows = app._render_result_pages(result, ["id", "name"])
+    out = app.console.export_text()
+    assert rows == [(i, f"item_{i}") for i in range(5)]
+    assert result.fetch_sizes == [2, 2, 2, 2]
+    assert out.count("name") == 1  # header only on the first page
+    assert "item_4" in out
+
+
+def test_render_result_pages_single_page_is_a_normal_table():
+    app: ChatApp = ChatApp.__new__(ChatApp)
+    app.console = Console(record=True, width=120)
+    app.page_size = 200
+
+    result = _PagedResult([(1, "a")])
+    assert app._render_result_pages(result, ["id", "name"]) == [(1, "a")]
+    assert result.fetch_sizes == [200]
+    assert "name" in app.console.export_text()
+
+    empty = _PagedResult([])
+    assert app._render_result_pages(empty, ["id"]) == []
+    assert "No rows returned" in app.console.export_text()
@@ -10,9 +10,13 @@ from rich.console import Console
 from src.cli import (
     StreamingDisplay,
     _extract_column_names_from_sql,
+    _format_timestamp,
     _format_value,
     _generate_automatic_analysis,
     _infer_column_headers,
+    _parse_structured_response,
+    _split_select_clause,
+    _split_table_line,
 )
 
 
@@ -33,6 +37,16 @@ def test_extract_column_names_returns_none_on_unparseable_sql():
     assert _extract_column_names_from_sql("INVALID", 1) is None
 
 
+def test_split_select_clause_respects_parens_and_quotes():
+    clause = "SUM(s.revenue) AS total, CONCAT(a, ',', b) x, 'a,b' AS lit, \"x,y\" z"
+    assert _split_select_clause(clause) == [
+        "SUM(s.revenue) AS total",
+        "CONCAT(a, ',', b) x",
+        "'a,b' AS lit",
+        '"x,y" z',
+    ]
+
+
 def test_infer_column_headers_numeric_patterns():
     data = [
         [1, 2000, 3],
@@ -44,6 +58,11 @@ def test_infer_column_headers_numeric_patterns():
     assert headers[2] == "Stock / Inventario"
 
 
+def test_infer_column_headers_ragged_rows():
+    data = [(1,), (2, 5000), (3, None, 7)]
+    assert _infer_column_headers(data, 4) == ["ID", "Total Vendido", "Stock / Inventario", "Columna 4"]
+
+
 def test_infer_column_headers_empty_data():
     assert _infer_column_headers([], 2) == ["Columna 1", "Columna 2"]
 
@@ -54,6 +73,13 @@ def test_format_value_various_types():
     assert _format_value(12.0) == "12"
     assert _format_value(12.5) == "12.50"
     assert _format_value(Decimal("10.00")) == "10"
+    assert _format_value(Decimal("Infinity")) == "Infinity"
+    assert _format_value(Decimal("sNaN")) == "sNaN"
+    assert _format_value(Decimal("1e400")) == "1E+400"
+    assert _format_value(Decimal("1234.567")) == "1,234.57"
+    assert _format_value(True) == "1"
+    assert _format_value(float("nan")) == "nan"
+    assert _format_value("texto") == "texto"
 
 
 def test_generate_automatic_analysis_basic_and_empty():
@@ -64,6 +90,35 @@ def test_generate_automatic_analysis_basic_and_empty():
     assert "valor m" in analysis.lower()
 
 
+def test_cached_automatic_analysis_reuses_result_for_same_response(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    calls = []
+    original = cli_module._generate_automatic_analysis
+
+    def counting(data, sql=None, question=""):
+        calls.append(data)
+        return original(data, sql, question)
+
+    monkeypatch.setattr(cli_module, "_generate_automatic_analysis", counting)
+    monkeypatch.setattr(cli_module, "_analysis_cache", cli_module.OrderedDict())
+    data = [("a", 1), ("b", 2)]
+    first = cli_module._cached_automatic_analysis("[('a', 1), ('b', 2)]", data, "SELECT 1", "q")
+    second = cli_module._cached_automatic_analysis("[('a', 1), ('b', 2)]", data, "SELECT 1", "q")
+    cli_module._cached_automatic_analysis("[('a', 1), ('b', 3)]", [("a", 1), ("b", 3)], "SELECT 1", "q")
+    assert first == second
+    assert len(calls) == 2
+
+
+def test_generate_automatic_analysis_max_row_and_zero_sales():
+    data = [("a", 0, 10), ("b", 30, 1), ("c", "n/a", 5), ("d", 30, 3)]
+    analysis = _generate_automatic_analysis(data, question="productos vendidos")
+    assert "El valor máximo es 30 (b)" in analysis
+    assert "el mínimo es 0" in analysis
+    assert "Hay 2 productos con stock por debajo del promedio" in analysis
+    assert "Nota: 1 productos no tienen ventas" in analysis
+
+
 def test_streaming_display_update_sets_fields():
     display = StreamingDisplay()
     display.update({"type": "sql", "content": "SELECT 1"})
@@ -74,6 +129,97 @@ def test_streaming_display_update_sets_fields():
     assert display.error == "boom"
 
 
+def test_streaming_display_coalesces_bursts(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    class FakeLive:
+        def __init__(self):
+            self.refreshes = 0
+            self.stopped = False
+
+        def refresh(self):
+            self.refreshes += 1
+
+        def stop(self):
+            self.stopped = True
+
+    clock = iter([10.0, 10.01, 10.02, 10.5, 10.51])
+    monkeypatch.setattr(cli_module.time, "monotonic", lambda: next(clock))
+    display = StreamingDisplay()
+    live = FakeLive()
+    display.live = live
+    for chunk in ("a", "b", "c", "d"):
+        display.update({"type": "analysis", "content": chunk})
+    assert live.refreshes == 2  # 10.0 and 10.5; the rest are coalesced
+    display.update({"type": "error", "content": "boom"})
+    assert live.refreshes == 3  # errors always render
+    assert display.analysis == "abcd"
+    display.stop()
+    assert live.stopped
+
+
+def test_streaming_display_live_shows_coalesced_trailing_chunk(monkeypatch: pytest.MonkeyPatch):
+    import io
+
+    import src.cli as cli_module
+
+    now = {"value": 10.0}
+    monkeypatch.setattr(cli_module.time, "monotonic", lambda: now["value"])
+    monkeypatch.setattr(cli_module, "console", Console(file=io.StringIO(), width=100, height=40))
+
+    display = StreamingDisplay()
+    display.start()
+    try:
+        display.update({"type": "sql", "content": "SELECT country, total FROM sales"})
+        now["value"] = 10.01  # within the coalescing window: no immediate refresh
+        display.update({"type": "data", "content": "[('USA', 100), ('CA', 50)]"})
+
+        # What Live repaints on its next auto-refresh already includes the data chunk
+        capture = Console(file=io.StringIO(), width=100, height=40, record=True)
+        capture.print(display.live.renderable)
+        out = capture.export_text()
+        assert "('USA', 100)" in out
+        assert "Esperando datos..." not in out
+    finally:
+        display.stop()
+
+
+def test_streaming_display_accumulates_analysis_chunks_as_parts():
+    display = StreamingDisplay()
+    assert display.analysis == ""
+    for chunk in ("Las ventas ", "subieron ", "", "un 10%."):
+        display.update({"type": "analysis", "content": chunk})
+    assert display._analysis_parts == ["Las ventas ", "subieron ", "un 10%."]
+    assert display.analysis == "Las ventas subieron un 10%."
+    # The joined text is kept, so later chunks append to a single part
+    assert display._analysis_parts == ["Las ventas subieron un 10%."]
+    display.update({"type": "analysis", "content": " Fin."})
+    assert display.analysis == "Las ventas subieron un 10%. Fin."
+
+
+def test_streaming_display_truncates_data_once():
+    display = StreamingDisplay()
+    assert display._data_display == "Esperando datos..."
+    display.update({"type": "data", "content": "x" * 600})
+    assert display.data == "x" * 600
+    assert display._data_display == "x" * 500 + "..."
+
+
+def test_streaming_display_render_reuses_unchanged_panels():
+    display = StreamingDisplay()
+    display.update({"type": "sql", "content": "SELECT 1"})
+    layout = display._render()
+    sql_panel = layout["sql"].renderable
+    display.update({"type": "analysis", "content": "hi"})
+    second = display._render()
+    assert second is layout
+    assert second["sql"].renderable is sql_panel
+    display.update({"type": "error", "content": "boom"})
+    third = display._render()
+    assert third is not layout
+    assert third["sql"].renderable is sql_panel
+
+
 def test_format_query_result_renders_table_and_analysis(monkeypatch: pytest.MonkeyPatch):
     import src.cli as cli_module
 
@@ -90,6 +236,9 @@ def test_format_query_result_renders_table_and_analysis(monkeypatch: pytest.Monk
     out = rec_console.export_text()
     assert "USA" in out
     assert "CA" in out
+    # Rendered as a rounded table, not the raw list text
+    assert "╭" in out
+    assert "[(" not in out
 
 
 def test_format_query_result_handles_dict(monkeypatch: pytest.MonkeyPatch):
@@ -101,3 +250,224 @@ def test_format_query_result_handles_dict(monkeypatch: pytest.MonkeyPatch):
     cli_module._format_query_result('{"a": 1, "b": 2}', output_format="table")
     out = rec_console.export_text()
     assert "a" in out and "b" in out
+
+
+def test_format_query_result_large_table_renders_all_rows(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    rec_console = Console(record=True, width=120)
+    monkeypatch.setattr(cli_module, "console", rec_console)
+    tables = []
+
+    class RecordingTable(cli_module.Table):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            tables.append(self)
+
+    monkeypatch.setattr(cli_module, "Table", RecordingTable)
+
+    long_name = "a much longer item name than any sampled row"
+    rows = [(f"item_{i}", i) for i in range(cli_module._FIXED_WIDTH_MIN_ROWS + 1)]
+    rows.append((long_name, 0))
+    cli_module._format_query_result(repr(rows), output_format="table")
+    out = rec_console.export_text()
+    # A table was rendered (not the raw list text)
+    assert "╭" in out
+    assert not out.lstrip().startswith("[(")
+    assert "item_0" in out
+    assert f"item_{cli_module._FIXED_WIDTH_MIN_ROWS}" in out
+    # Columns get a fixed width from the sample; the longer cell folds instead of widening it
+    assert tables and all(column.width is not None for column in tables[0].columns)
+    assert tables[0].columns[0].width < len(long_name)
+    assert long_name not in out
+    assert "sampled" in out
+
+
+def test_extract_column_names_is_memoized_and_returns_fresh_lists():
+    import src.cli as cli_module
+
+    sql = "SELECT country, SUM(revenue) AS total_revenue FROM sales"
+    first = _extract_column_names_from_sql(sql, 2)
+    first.append("mutated")
+    second = _extract_column_names_from_sql(sql, 2)
+    assert second == ["Country", "Total Revenue"]
+    assert cli_module._extract_column_names_cached.cache_info().hits >= 1
+
+
+def test_split_select_clause_skips_empty_and_unclosed_quotes():
+    assert _split_select_clause("a, , b") == ["a", "b"]
+    assert _split_select_clause("a, 'b, c") == ["a", "'b, c"]
+    assert _split_select_clause("COALESCE(x, 0)") == ["COALESCE(x, 0)"]
+
+
+def test_extract_column_names_classifies_aggregates_and_dates():
+    sql = (
+        "SELECT SUM(s.total_amount), count(*), AVG(x), max(y), MIN(z), "
+        "DATE_TRUNC('month', d), SUM(1), maximum(q) FROM t"
+    )
+    assert _extract_column_names_from_sql(sql, 8) == [
+        "Total Total Amount",
+        "Cantidad",
+        "Promedio",
+        "Máximo",
+        "Mínimo",
+        "Mes",
+        "Total",
+        "Maximum",
+    ]
+
+
+def test_infer_column_headers_string_numbers_and_wide_rows():
+    data = [["a", "1,500", "7", "x", 1, 2]]
+    headers = _infer_column_headers(data, 6)
+    assert headers == ["Nombre / Descripción", "Total Vendido", "Stock / Inventario", "Información", "Columna 5", "Columna 6"]
+
+
+def test_parse_structured_response_paths():
+    assert _parse_structured_response('[["a", 1]]') == [["a", 1]]
+    assert _parse_structured_response("[(1, 2.5), (3, 4)]") == [[1, 2.5], [3, 4]]
+    # Parens inside strings are left alone (literal_eval path)
+    assert _parse_structured_response("[('a (b)', None)]") == [("a (b)", None)]
+    assert _parse_structured_response("[(1,\n 'x'),\n (2, 'y')]") == [(1, "x"), (2, "y")]
+    with pytest.raises(ValueError):
+        _parse_structured_response("Hay 3 clientes")
+
+
+def test_split_table_line():
+    assert _split_table_line("| a | b |") == ["a", "b"]
+    assert _split_table_line("x\t\ty ") == ["x", "y"]
+    assert _split_table_line("plain text") is None
+
+
+def test_format_query_result_text_table_with_outro(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    rec_console = Console(record=True, width=120)
+    monkeypatch.setattr(cli_module, "console", rec_console)
+
+    response = "Resultados:\n| país | total |\n| USA | 10 |\n| CA | 5 | extra |\nLa mayoría de las ventas vienen de USA."
+    cli_module._format_query_result(response, output_format="table")
+    out = rec_console.export_text()
+    assert "USA" in out
+    assert "extra" not in out
+    assert "La mayoría de las ventas" in out
+
+
+def test_export_results_sanitizes_filename(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cli_module, "console", Console(record=True))
+    cli_module._export_results("[(1,)]", "SELECT 1", "csv", "¿Ventas por país/región?")
+    (exported,) = tmp_path.glob("*.csv")
+    assert exported.name.startswith("query_Ventas_por_paísregión_")
+
+
+def test_export_results_csv_and_json_contents(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    import json
+
+    import src.cli as cli_module
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cli_module, "console", Console(record=True))
+    cli_module._export_results("[('Perú', 1)]", "SELECT 1", "csv", "ventas")
+    cli_module._export_results("[('Perú', 1)]", None, "json", "ventas")
+    (csv_file,) = tmp_path.glob("*.csv")
+    assert csv_file.read_text(encoding="utf-8") == "Query: ventas\nSQL: SELECT 1\n\nResultados:\n[('Perú', 1)]"
+    (json_file,) = tmp_path.glob("*.json")
+    exported = json.loads(json_file.read_text(encoding="utf-8"))
+    assert exported["results"] == "[('Perú', 1)]"
+    assert exported["sql"] is None
+    assert "Perú" in json_file.read_text(encoding="utf-8")
+
+
+def test_format_query_result_plain_text_skips_structured_parse(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    def fail(_text):
+        raise AssertionError("plain text should not be parsed")
+
+    rec_console = Console(record=True, width=80)
+    monkeypatch.setattr(cli_module, "console", rec_console)
+    monkeypatch.setattr(cli_module, "_parse_structured_response", fail)
+    cli_module._format_query_result("Hay 3 clientes registrados.", output_format="table")
+    assert "Hay 3 clientes" in rec_console.export_text()
+
+
+def test_format_query_result_unicode_table_extracts_intro_and_analysis(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    rec_console = Console(record=True, width=120)
+    monkeypatch.setattr(cli_module, "console", rec_console)
+
+    response = (
+        "Estos son los productos más vendidos del mes:\n"
+        "┏━━━━━━┓\n┃ prod ┃\n┡━━━━━━┩\n│ A    │\n"
+        "Conclusión: el producto A lidera las ventas.\n"
+        "──────"
+    )
+    cli_module._format_query_result(response, output_format="table")
+    out = rec_console.export_text()
+    assert "Estos son los productos" in out
+    assert "Conclusión: el producto A lidera" in out
+
+
+def test_text_after_table_drops_table_lines():
+    import src.cli as cli_module
+
+    lines = ["", "| A | 1 |", "└───┘", "Conclusión: A lidera.", "  "]
+    assert cli_module._text_after_table(lines) == "Conclusión: A lidera."
+    assert cli_module._text_after_table(["──────"]) == ""
+
+
+def test_truncate():
+    import src.cli as cli_module
+
+    assert cli_module._truncate("abc", 3) == "abc"
+    assert cli_module._truncate("abcdef", 5) == "ab..."
+    assert len(cli_module._truncate("x" * 100, 60)) == 60
+
+
+def test_format_timestamp_matches_isoformat_parse():
+    from datetime import datetime
+
+    for ts in ("2024-05-01T10:20:30.123456", "2024-05-01 10:20:30", "2024-05-01T10:20:30+02:00", "2024-05-01", "2024-05-01T10:20"):
+        assert _format_timestamp(ts) == datetime.fromisoformat(ts).strftime("%Y-%m-%d %H:%M:%S")
+    assert _format_timestamp("not a timestamp") == "not a timestamp"
+    # Separators in the right places are not enough: digits are required to slice
+    assert _format_timestamp("abcd-ef-ghTij:kl:mn") == "abcd-ef-ghTij:kl:mn"
+    assert _format_timestamp("2024-13-45") == "2024-13-45"
+
+
+def test_format_query_result_prints_rows_as_rounded_table_in_one_call(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    rec_console = Console(record=True, width=120)
+    printed = []
+    monkeypatch.setattr(rec_console, "print", lambda *objs, **kw: printed.append(objs) or Console.print(rec_console, *objs, **kw))
+    monkeypatch.setattr(cli_module, "console", rec_console)
+
+    cli_module._format_query_result("[('USA', 100), ('CA', 50)]", output_format="table", sql_generated="SELECT country, total FROM t")
+    out = rec_console.export_text()
+    # Rendered as a table (not the raw list text), table + analysis in a single print
+    assert "╭" in out and "Country" in out
+    assert "[(" not in out
+    assert len(printed) == 1
+
+
+def test_format_query_result_json_format_skips_table_detection(monkeypatch: pytest.MonkeyPatch):
+    import src.cli as cli_module
+
+    def fail(_text):
+        raise AssertionError("json output should not look for tables")
+
+    rec_console = Console(record=True, width=80)
+    monkeypatch.setattr(cli_module, "console", rec_console)
+    monkeypatch.setattr(cli_module, "_looks_structured", fail)
+    cli_module._format_query_result('[{"pais": "USA", "total": 10}]', output_format="json")
+    cli_module._format_query_result("Hay 3 clientes registrados en total en la base de datos.", output_format="json")
+    out = rec_console.export_text()
+    assert '"pais": "USA"' in out
+    assert "╭" not in out
+    # Non-JSON text is printed once, not again as an analysis block
+    assert out.count("Hay 3 clientes") == 1
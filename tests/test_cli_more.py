@@ -132,3 +132,44 @@ def test_query_command_handles_sql_validation_error(
     result = runner.invoke(cli, ["query", "pregunta"])
     assert result.exit_code == 1
     assert "Error de validación SQL" in result.output
+
+
+@pytest.mark.parametrize("extra_args", [["--verbose"], []])
+@patch("src.cli.load_schema")
+@patch("src.cli.get_db_engine")
+@patch("src.cli.create_sql_agent")
+@patch("src.cli.execute_query")
+@patch("src.cli.explain_query")
+@patch("src.utils.semantic_cache.initialize_semantic_cache")
+@patch("src.cli.save_query")
+@patch("src.cli.record_query_performance")
+@patch("src.cli._format_query_result")
+def test_query_command_explain_executes_once(
+    mock_format,
+    _mock_record_perf,
+    _mock_save,
+    _mock_semantic_init,
+    mock_explain,
+    mock_execute,
+    mock_create_agent,
+    mock_engine,
+    mock_schema,
+    extra_args,
+    runner,
+    sample_schema,
+):
+    mock_schema.return_value = sample_schema
+    mock_engine.return_value = MagicMock()
+    mock_create_agent.return_value = MagicMock()
+    mock_explain.return_value = "explicación"
+    mock_execute.return_value = {
+        "response": "ok",
+        "sql_generated": "SELECT 1",
+        "execution_time": 0.1,
+        "success": True,
+    }
+
+    result = runner.invoke(cli, ["query", "pregunta", "--explain", *extra_args])
+    assert result.exit_code == 0
+    mock_execute.assert_called_once()
+    assert mock_format.call_args[0][0] == "ok"
@@ -99,3 +99,14 @@ def test_load_schema_internal_discovery_exception_falls_back(monkeypatch):
 
     loaded = database_schema._load_schema_internal(use_discovery=True)
     assert loaded.tables  # usa estático
+
+
+def test_schema_prompt_text_is_cached_per_schema_object(rich_schema):
+    first = get_schema_for_prompt(rich_schema)
+    assert get_schema_for_prompt(rich_schema) is first
+    compact = get_schema_for_prompt_compact(rich_schema)
+    assert get_schema_for_prompt_compact(rich_schema) is compact
+
+    other = rich_schema.model_copy(deep=True)
+    other.tables.pop("products", None)
+    assert get_schema_for_prompt(other) is not first
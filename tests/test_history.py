@@ -10,7 +10,9 @@ import pytest
 from src.utils.history import (
     clear_history,
     get_history_entry,
+    build_history_entry,
     load_history,
+    save_history_entries,
     save_query,
     HISTORY_FILE,
     MAX_HISTORY_ENTRIES,
@@ -130,3 +132,81 @@ def test_clear_history_handles_unlink_error(temp_history_file):
         "src.utils.history.Path.unlink", side_effect=OSError("boom")
     ):
         clear_history()
+
+
+def test_save_query_appends_jsonl_lines(temp_history_file):
+    """Test: save_query agrega una línea JSON por entrada."""
+    with patch("src.utils.history.HISTORY_FILE", temp_history_file):
+        save_query("q1", "SQL 1", "r1")
+        save_query("q2", "SQL 2", "r2")
+
+    lines = temp_history_file.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["question"] for line in lines] == ["q1", "q2"]
+
+
+def test_load_history_migrates_legacy_json_array(temp_history_file):
+    """Test: un historial en formato array JSON se lee y se migra a JSONL al guardar."""
+    legacy = [
+        {"timestamp": "2025-01-02T00:00:00", "question": "old 2"},
+        {"timestamp": "2025-01-01T00:00:00", "question": "old 1"},
+    ]
+    temp_history_file.write_text(json.dumps(legacy, indent=2), encoding="utf-8")
+
+    with patch("src.utils.history.HISTORY_FILE", temp_history_file):
+        assert [e["question"] for e in load_history()] == ["old 2", "old 1"]
+
+        save_query("new", "SQL", "r")
+        assert [e["question"] for e in load_history()] == ["new", "old 2", "old 1"]
+
+    assert not temp_history_file.read_text(encoding="utf-8").startswith("[")
+
+
+def test_save_query_compacts_file(temp_history_file):
+    """Test: el archivo se compacta al superar 2 * MAX_HISTORY_ENTRIES líneas."""
+    with patch("src.utils.history.HISTORY_FILE", temp_history_file), patch(
+        "src.utils.history.MAX_HISTORY_ENTRIES", 2
+    ):
+        for i in range(5):
+            save_query(f"q{i}", "SQL", "r")
+
+        assert len(temp_history_file.read_text(encoding="utf-8").splitlines()) <= 4
+        assert [e["question"] for e in load_history()] == ["q4", "q3"]
+
+
+def test_save_query_recounts_before_compacting(temp_history_file):
+    """Test: un conteo local desactualizado (otro proceso) no descarta líneas al compactar."""
+    with patch("src.utils.history.HISTORY_FILE", temp_history_file), patch(
+        "src.utils.history.MAX_HISTORY_ENTRIES", 4
+    ):
+        for i in range(8):
+            save_query(f"q{i}", "SQL", "r")
+        # Otro proceso compactó el archivo y este conserva un conteo viejo
+        temp_history_file.write_text(
+            "".join(line + "\n" for line in temp_history_file.read_text(encoding="utf-8").splitlines()[-5:]),
+            encoding="utf-8",
+        )
+        save_query("q8", "SQL", "r")
+
+        assert len(temp_history_file.read_text(encoding="utf-8").splitlines()) == 6
+
+
+def test_load_history_reads_tail_across_chunks(temp_history_file):
+    """Test: la lectura del final funciona cuando las líneas cruzan bloques."""
+    lines = [json.dumps({"timestamp": "t", "question": f"q{i}", "sql": "x" * 50}) for i in range(50)]
+    temp_history_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    with patch("src.utils.history.HISTORY_FILE", temp_history_file), patch(
+        "src.utils.history._TAIL_CHUNK_SIZE", 64
+    ):
+        history = load_history(limit=3)
+
+    assert [e["question"] for e in history] == ["q49", "q48", "q47"]
+
+
+def test_save_history_entries_writes_batch(temp_history_file):
+    """Test: save_history_entries agrega varias entradas en orden."""
+    with patch("src.utils.history.HISTORY_FILE", temp_history_file):
+        save_history_entries([build_history_entry("q1", "SQL 1"), build_history_entry("q2", "SQL 2")])
+        save_query("q3", "SQL 3", "r3")
+
+        assert [e["question"] for e in load_history()] == ["q3", "q2", "q1"]
@@ -105,3 +105,17 @@ def test_clear_performance_metrics_handles_unlink_error(monkeypatch, temp_perf_f
     temp_perf_file.write_text("[]", encoding="utf-8")
     monkeypatch.setattr(performance.Path, "unlink", lambda *_a, **_k: (_ for _ in ()).throw(OSError("boom")))
     performance.clear_performance_metrics()
+
+
+def test_get_slow_queries_top_n_keeps_order_on_ties(temp_perf_file):
+    now = datetime.now().isoformat()
+    metrics = [
+        {"timestamp": now, "sql": "SELECT 1", "sql_hash": "a", "execution_time": 6.0, "success": True},
+        {"timestamp": now, "sql": "SELECT 2", "sql_hash": "b", "execution_time": 9.0, "success": True},
+        {"timestamp": now, "sql": "SELECT 3", "sql_hash": "c", "execution_time": 6.0, "success": True},
+        {"timestamp": now, "sql": "SELECT 2", "sql_hash": "b", "execution_time": 9.0, "success": True},
+    ]
+    temp_perf_file.write_text(json.dumps(metrics), encoding="utf-8")
+
+    slow = performance.get_slow_queries(threshold_seconds=5.0, limit=2)
+    assert [q["sql"] for q in slow] == ["SELECT 2", "SELECT 1"]
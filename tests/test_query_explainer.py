@@ -74,3 +74,26 @@ def test_explain_query_simple_handles_exception(monkeypatch):
     monkeypatch.setattr(query_explainer, "get_chat_model", lambda *a, **k: DummyLLM())
     out = query_explainer.explain_query_simple("SELECT 1")
     assert "Error al generar explicación" in out
+
+
+def test_explain_query_caches_by_normalized_sql(monkeypatch):
+    engine = MagicMock()
+    query_explainer.clear_explain_cache()
+    monkeypatch.setattr(query_explainer, "_get_explain_plan", lambda sql, eng: "plan")
+
+    calls = []
+
+    class DummyLLM:
+        def invoke(self, prompt):
+            calls.append(prompt)
+            return SimpleNamespace(content="explicación")
+
+    monkeypatch.setattr(query_explainer, "get_chat_model", lambda *a, **k: DummyLLM())
+
+    assert query_explainer.explain_query("SELECT id FROM sales", engine) == "explicación"
+    assert query_explainer.explain_query("select   id\nFROM sales", engine) == "explicación"
+    assert len(calls) == 1
+
+    query_explainer.clear_explain_cache()
+    query_explainer.explain_query("SELECT id FROM sales", engine)
+    assert len(calls) == 2
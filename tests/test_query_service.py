@@ -0,0 +1,199 @@
+"""Tests for src.api.services.query_service helpers."""
+
+from __future__ import annotations
+
+import pytest
+
+import src.api.services.query_service as query_service
+from src.api.services.query_service import _parse_rows_from_response
+
+
+def test_parse_rows_from_python_tuples():
+    columns, rows = _parse_rows_from_response(
+        "[('Madrid', 10), ('Lima', 5)]",
+        "SELECT city, total FROM sales",
+        None,
+    )
+    assert columns == ["city", "total"]
+    assert rows == [{"city": "Madrid", "total": 10}, {"city": "Lima", "total": 5}]
+
+
+def test_parse_rows_from_json_lists_uses_fast_path():
+    columns, rows = _parse_rows_from_response('[["a", 1, null, true]]', None, None)
+    assert columns == ["col_1", "col_2", "col_3", "col_4"]
+    assert rows == [{"col_1": "a", "col_2": 1, "col_3": None, "col_4": True}]
+
+
+def test_parse_rows_from_dicts_unions_columns_in_order():
+    columns, rows = _parse_rows_from_response('[{"a": 1}, {"b": 2, "a": 3}]', None, None)
+    assert columns == ["a", "b"]
+    assert rows == [{"a": 1}, {"b": 2, "a": 3}]
+
+
+def test_parse_rows_applies_limit():
+    _, rows = _parse_rows_from_response("[(1,), (2,), (3,)]", None, 2)
+    assert rows == [{"col_1": 1}, {"col_1": 2}]
+
+
+def test_parse_rows_rejects_plain_text():
+    assert _parse_rows_from_response("Las ventas subieron un 10%.", None, None) == (None, None)
+    assert _parse_rows_from_response("[no es un literal", None, None) == (None, None)
+
+
+def test_parse_rows_pads_short_rows_and_truncates_long_rows():
+    _, rows = _parse_rows_from_response("[(1, 2), (3,), (4, 5, 6)]", None, None)
+    assert rows == [
+        {"col_1": 1, "col_2": 2},
+        {"col_1": 3, "col_2": None},
+        {"col_1": 4, "col_2": 5},
+    ]
+
+
+def test_build_query_response_keeps_parsed_rows(monkeypatch):
+    monkeypatch.setattr(query_service, "_save_query_in_background", lambda **_kwargs: None)
+    parsed_rows = [{"col_1": 1}]
+    monkeypatch.setattr(query_service, "_parse_rows_from_response", lambda *_args: (["col_1"], parsed_rows))
+
+    response = query_service._build_query_response(
+        question="q",
+        engine=None,
+        execute_result={"response": "[(1,)]", "sql_generated": None, "success": False, "execution_time": 0.5},
+        limit=None,
+        explain=False,
+    )
+
+    assert response.rows is parsed_rows
+    assert response.execution_time == 0.5
+    assert response.error is not None and response.error.code == "query_failed"
+    assert response.model_dump()["columns"] == ["col_1"]
+
+
+def test_shared_agent_reused_until_schema_changes(monkeypatch):
+    created = []
+    monkeypatch.setattr(query_service, "create_sql_agent", lambda engine, schema: created.append(schema) or object())
+    query_service.reset_shared_agent()
+
+    engine, schema_v1, schema_v2 = object(), object(), object()
+    first = query_service._get_shared_agent(engine, schema_v1)
+    assert query_service._get_shared_agent(engine, schema_v1) is first
+    assert query_service._get_shared_agent(engine, schema_v2) is not first
+    assert created == [schema_v1, schema_v2]
+
+    query_service.reset_shared_agent()
+
+
+def test_extract_column_names_caches_parse_and_handles_cast():
+    query_service._parse_select.cache_clear()
+    sql = "SELECT CAST(a + b AS INT), name FROM t"
+
+    assert query_service._extract_column_names_from_sql(sql, 2) == ["CAST(a + b AS INT)", "name"]
+    assert query_service._extract_column_names_from_sql(sql, 2) == ["CAST(a + b AS INT)", "name"]
+    assert query_service._parse_select.cache_info().hits == 1
+
+
+def test_parse_rows_retries_with_collapsed_whitespace():
+    _, rows = _parse_rows_from_response("[('Lima,\n Peru', 1)]", None, None)
+    assert rows == [{"col_1": "Lima, Peru", "col_2": 1}]
+
+
+def test_parse_rows_limit_on_dict_rows_skips_non_dicts():
+    columns, rows = _parse_rows_from_response('[{"a": 1}, 5, {"b": 2}, {"c": 3}]', None, 2)
+    assert rows == [{"a": 1}, {"b": 2}]
+    assert columns == ["a", "b"]
+
+
+def test_get_or_create_agent_preloads_embeddings_once(monkeypatch):
+    calls = []
+    engine, schema, agent = object(), object(), object()
+    monkeypatch.setattr(query_service, "_semantic_cache_ready", False)
+    monkeypatch.setattr(query_service, "initialize_semantic_cache", lambda: calls.append(True))
+    monkeypatch.setattr(query_service, "load_schema", lambda **_kwargs: schema)
+    monkeypatch.setattr(query_service, "get_db_engine", lambda: engine)
+    monkeypatch.setattr(query_service, "_get_shared_agent", lambda eng, sch: agent)
+
+    assert query_service.get_or_create_agent() == (engine, agent)
+    assert query_service.get_or_create_agent() == (engine, agent)
+    assert calls == [True]
+
+
+def test_extract_column_names_skips_select_star(monkeypatch):
+    monkeypatch.setattr(query_service, "_parse_select", lambda sql: (_ for _ in ()).throw(AssertionError(sql)))
+    assert query_service._extract_column_names_from_sql("  select *\n FROM sales", 1) is None
+
+    columns, _ = _parse_rows_from_response("[(1,)]", "SELECT * FROM sales", None)
+    assert columns == ["col_1"]
+
+
+def test_parse_rows_pads_short_json_list_rows():
+    _, rows = _parse_rows_from_response("[[1, 2], [3]]", None, None)
+    assert rows == [{"col_1": 1, "col_2": 2}, {"col_1": 3, "col_2": None}]
+
+
+def test_parse_rows_streams_large_json_with_limit(monkeypatch):
+    pytest.importorskip("ijson")
+    monkeypatch.setattr(query_service, "_STREAM_PARSE_MIN_CHARS", 10)
+    payload = "[[1, 2.5, \"a\"], [2, 3.5, null], [3, 4.5, \"c\"], not json]"
+
+    columns, rows = _parse_rows_from_response(payload, None, 2)
+    assert columns == ["col_1", "col_2", "col_3"]
+    assert rows == [{"col_1": 1, "col_2": 2.5, "col_3": "a"}, {"col_1": 2, "col_2": 3.5, "col_3": None}]
+
+
+def test_parse_rows_stream_falls_back_for_python_repr(monkeypatch):
+    pytest.importorskip("ijson")
+    monkeypatch.setattr(query_service, "_STREAM_PARSE_MIN_CHARS", 10)
+
+    _, rows = _parse_rows_from_response("[('Madrid', 10), ('Lima', 5)]", None, 1)
+    assert rows == [{"col_1": "Madrid", "col_2": 10}]
+
+
+def test_parse_rows_rejects_text_that_only_starts_like_a_list(monkeypatch):
+    monkeypatch.setattr(query_service, "_literal_eval_rows", lambda _text: pytest.fail("should not parse"))
+    assert _parse_rows_from_response("[Nota] Hay 3 ventas registradas.", None, None) == (None, None)
+
+
+def test_save_query_in_background_batches_and_survives_failures(monkeypatch):
+    batches = []
+
+    def fake_save_history_entries(entries):
+        batches.append([entry["question"] for entry in entries])
+        raise OSError("disk full")
+
+    monkeypatch.setattr(query_service, "save_history_entries", fake_save_history_entries)
+
+    query_service._save_query_in_background(question="q1", sql=None)
+    query_service._HISTORY_QUEUE.join()
+    query_service._save_query_in_background(question="q2", sql="SELECT 1")
+    query_service._HISTORY_QUEUE.join()
+
+    assert [q for batch in batches for q in batch] == ["q1", "q2"]
+
+
+def test_extract_column_names_token_fast_path_matches_ast(monkeypatch):
+    sql = 'SELECT DISTINCT c.name AS customer, "Total X", t.region, SUM(s.revenue) AS total FROM sales s'
+    expected = query_service._extract_column_names_from_sql(sql, 4)
+    assert expected == ["customer", "Total X", "region", "total"]
+
+    monkeypatch.setattr(query_service, "_parse_select", lambda _sql: pytest.fail("AST should not be needed"))
+    query_service._project_headers_from_tokens.cache_clear()
+    assert query_service._extract_column_names_from_sql(sql, 4) == expected
+
+
+def test_project_headers_from_tokens_defers_complex_items():
+    assert query_service._project_headers_from_tokens("SELECT SUM(x) FROM t", 1) is None
+    assert query_service._project_headers_from_tokens("WITH x AS (SELECT 1) SELECT a FROM x", 1) is None
+    assert query_service._project_headers_from_tokens("SELECT a, b FROM t", 1) == ("a",)
+
+
+def test_parse_rows_skips_oversized_responses(monkeypatch):
+    monkeypatch.setattr(query_service, "_MAX_PARSE_CHARS", 10)
+    assert _parse_rows_from_response("[(1, 2), (3, 4), (5, 6)]", None, None) == (None, None)
+    assert _parse_rows_from_response("[(1, 2)]", None, None)[1] == [{"col_1": 1, "col_2": 2}]
+
+
+def test_default_headers_are_cached_and_interned():
+    first, _ = _parse_rows_from_response("[(1, 2)]", None, None)
+    second, _ = _parse_rows_from_response("[(3, 4)]", None, None)
+    assert first == second == ["col_1", "col_2"]
+    assert first is not second
+    assert all(a is b for a, b in zip(first, second))
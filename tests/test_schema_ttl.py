@@ -184,3 +184,43 @@ def test_schema_cache_with_discovery_disabled():
         schema2 = load_schema()
         assert schema1 is schema2
 
+
+
+def test_schema_cache_stale_while_revalidate(monkeypatch):
+    """Verifica que con stale_while_revalidate se sirve el schema expirado y se refresca en background."""
+    from src.schemas import database_schema
+
+    invalidate_schema_cache()
+    monkeypatch.setenv("SCHEMA_DISCOVERY", "false")
+
+    schema1 = load_schema()
+    version1 = database_schema.get_schema_version()
+    database_schema._schema_cache.fetched_at = datetime.now() - timedelta(seconds=600)
+
+    refreshed = []
+    monkeypatch.setattr(database_schema, "refresh_schema_async", lambda use_discovery=None: refreshed.append(True))
+
+    schema2 = load_schema(stale_while_revalidate=True)
+
+    assert schema2 is schema1
+    assert refreshed == [True]
+    assert database_schema.get_schema_version() == version1
+
+
+def test_refresh_schema_async_reloads_and_bumps_version(monkeypatch):
+    """Verifica que el refresh en background recarga el schema e incrementa la versión."""
+    from src.schemas import database_schema
+
+    invalidate_schema_cache()
+    monkeypatch.setenv("SCHEMA_DISCOVERY", "false")
+
+    schema1 = load_schema()
+    version1 = database_schema.get_schema_version()
+
+    assert database_schema.refresh_schema_async() is True
+    deadline = time.time() + 5
+    while database_schema._refresh_in_progress and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert database_schema.get_schema_version() == version1 + 1
+    assert load_schema() is not schema1
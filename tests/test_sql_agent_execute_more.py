@@ -182,7 +182,7 @@ def test_execute_query_records_sql_cache_hit_type(monkeypatch: pytest.MonkeyPatc
 
     def invoke(_payload):
         # Simula que la herramienta ejecutó desde cache SQL.
-        sql_agent._SQL_EXECUTION_INFO.set(("SELECT 1", True))
+        sql_agent._SQL_EXECUTION_INFO.set(sql_agent.SqlExecInfo("SELECT 1", True, "sql"))
         return {"messages": [sql_msg, tool_msg]}
 
     agent.invoke.side_effect = invoke
@@ -210,3 +210,20 @@ def test_execute_query_performance_metrics_error_is_caught(monkeypatch: pytest.M
 
     out = sql_agent.execute_query(agent, "q")
     assert out == "[(1,)]"
+
+
+def test_execute_query_can_skip_semantic_lookup(monkeypatch):
+    import src.agents.executor as executor
+
+    monkeypatch.setenv("ENABLE_SEMANTIC_CACHE", "true")
+    lookup = MagicMock(return_value=("cached", "SELECT 1"))
+    monkeypatch.setattr(executor, "get_semantic_cached_result", lookup)
+
+    assert executor.execute_query(MagicMock(), "q", return_metadata=True)["cache_hit_type"] == "semantic"
+    assert executor.semantic_cache_hit("q")["response"] == "cached"
+    assert lookup.call_count == 2
+
+    lookup.reset_mock()
+    monkeypatch.setenv("ENABLE_SEMANTIC_CACHE", "false")
+    assert executor.semantic_cache_hit("q") is None
+    lookup.assert_not_called()
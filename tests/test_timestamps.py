@@ -0,0 +1,28 @@
+"""Tests for src.utils.timestamps."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from src.utils.timestamps import filter_by_days, timestamp_to_epoch
+
+
+def test_timestamp_to_epoch_parses_and_caches():
+    timestamp_to_epoch.cache_clear()
+    ts = "2025-01-01T12:00:00"
+
+    assert timestamp_to_epoch(ts) == datetime(2025, 1, 1, 12).timestamp()
+    timestamp_to_epoch(ts)
+    assert timestamp_to_epoch.cache_info().hits == 1
+
+
+def test_timestamp_to_epoch_invalid_returns_none():
+    assert timestamp_to_epoch("not-a-date") is None
+
+
+def test_filter_by_days_skips_old_missing_and_invalid():
+    recent = {"timestamp": datetime.now().isoformat()}
+    old = {"timestamp": (datetime.now() - timedelta(days=30)).isoformat()}
+    entries = [recent, old, {"timestamp": None}, {}, {"timestamp": "bad"}]
+
+    assert filter_by_days(entries, days=7) == [recent]
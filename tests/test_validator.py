@@ -389,3 +389,13 @@ def test_validate_functions_blocks_unknown_function(validator):
     """Test: una función no-whitelist debe disparar SQLValidationError."""
     with pytest.raises(SQLValidationError):
         validator.validate_query("SELECT foo(id) FROM sales")
+
+
+def test_column_index_built_once_and_case_insensitive(validator):
+    """Test: el índice de columnas se calcula una vez y compara sin mayúsculas."""
+    validator.validate_query("SELECT S.Revenue, Category FROM Sales S JOIN products p ON S.id = p.id")
+    index = validator._column_index
+    validator.validate_query("SELECT quantity FROM sales")
+    assert validator._column_index is index
+    with pytest.raises(InvalidColumnError):
+        validator.validate_query("SELECT s.category FROM sales s")